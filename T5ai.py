@@ -1,125 +1,55 @@
-import re
-import json
-from transformers import pipeline, T5Tokenizer
-from rank_bm25 import BM25Okapi
-
-#Load JSON file and extract relevant content
-with open('scraped_info.json', 'r') as file:
-    data = json.load(file)
-
-documents = [item for item in data if 'content' in item]
-
-#Load the T5 model with text2text-generation pipeline
-qa_pipeline = pipeline("text2text-generation", model="t5-large")
-tokenizer = T5Tokenizer.from_pretrained("t5-large")
-
-#Max token limit for T5
-MAX_TOKENS = 512
-
-#Retrieve relevant context using BM25
-def retrieve_relevant_context(question, documents, top_n=3):
-    tokenized_docs = [doc.split() for doc in documents]
-    bm25 = BM25Okapi(tokenized_docs)
-    query_tokens = question.split()
-    scores = bm25.get_scores(query_tokens)
-
-    #Select top N most relevant documents
-    top_indices = scores.argsort()[-top_n:][::-1]
-    return " ".join([documents[i] for i in top_indices]) 
-
-def extract_course_code(question):
-    match = re.search(r'Computer Science \d{4}[A-Z]?/?[A-Z]?', question, re.IGNORECASE)
-    return match.group(0) if match else None
-
-#Truncate context if it exceeds the token limit
-def truncate_to_max_tokens(context):
-    #Tokenize the context and get the number of tokens
-    input_ids = tokenizer.encode(context, return_tensors="pt")
-    if input_ids.shape[1] > MAX_TOKENS:
-        truncated_input_ids = input_ids[:, :MAX_TOKENS]
-        context = tokenizer.decode(truncated_input_ids[0], skip_special_tokens=True)
-    return context
-
-#Answer questions 
+import argparse
+from qa_engine import QAEngine
+from answer_cache import AnswerCache
+from quantization import parity_check, print_parity, QUANTIZATIONS
+
+#Load the documents, BM25 index and the T5 question-answering backend.
+#Answers are kept in cache_db, so repeat questions skip the model; quantize='int8' runs the int8 model
+def create_engine(quantize='none', cache_db='answer_cache.db'):
+    cache = AnswerCache(db_path=cache_db) if cache_db else None
+    return QAEngine(['t5'], cache=cache, backend_options={'t5': {'quantize': quantize}})
+
+engine = None
+
+#The engine, created with the default configuration on first use unless one was created already
+def get_engine():
+    global engine
+    if engine is None:
+        engine = create_engine()
+    return engine
+
+#Answer questions
 def answer_question(question, documents):
-    course_code = extract_course_code(question)
-    if course_code:
-        filtered_docs = [doc for doc in documents if course_code in doc.get('title', '') or course_code in doc.get('content', '')]
-        if filtered_docs:
-            relevant_context = retrieve_relevant_context(question, [doc['content'] for doc in filtered_docs], top_n=3)
-            relevant_context = truncate_to_max_tokens(relevant_context) 
-            result = qa_pipeline(f"question: {question} context: {relevant_context}")
-            
-            #If answer looks too short, re-run it with more context
-            if len(result[0]['generated_text'].split()) < 15:  
-                relevant_context = retrieve_relevant_context(question, [doc['content'] for doc in filtered_docs], top_n=5)
-                relevant_context = truncate_to_max_tokens(relevant_context) 
-                result = qa_pipeline(f"question: {question} context: {relevant_context}")
-                
-            return validate_answer(result[0]['generated_text'])
-
-    relevant_context = retrieve_relevant_context(question, [doc['content'] for doc in documents], top_n=3)
-    relevant_context = truncate_to_max_tokens(relevant_context) 
-    result = qa_pipeline(f"question: {question} context: {relevant_context}")
-
-    #If answer looks too short, re-run it with more context
-    if len(result[0]['generated_text'].split()) < 15:
-        relevant_context = retrieve_relevant_context(question, [doc['content'] for doc in documents], top_n=5)
-        relevant_context = truncate_to_max_tokens(relevant_context) 
-        result = qa_pipeline(f"question: {question} context: {relevant_context}")
-    
-    return validate_answer(result[0]['generated_text'])
-
-#Vlidate the answer
-def validate_answer(answer):
-    if not answer or len(answer.split()) < 3:  
-        return "I don't know"
-
-    return answer
-
-
-
-question = "What time does Computer Science 4490 start?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "Who are the members of the Computer Science student council?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "What is the average class size for upper-level Computer Science courses?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "What types of extracurricular activities and clubs does the Computer Science department offer?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "Who won the 2024 Faculty of Science Distinguished Research Professor Award?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "What are the prerequisites for Computer Science 4447?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "Who is the new Canada Research Chair in Data Analytics and Digital Health in Cognitive Aging and Dementia?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "Do Computer Science students have acces to any free softwares?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "What are some sources of the department's research grants from?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "What Facilities does The Department of Computer Science occupy?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
-question = "What is Computer Science 1025 about?"
-answer = answer_question(question, documents)
-answer = validate_answer(answer)
-print(question, ": ", answer)
+    return get_engine().answer_question(question)
+
+#Answer a batch of questions with length-grouped, padded model batches
+def answer_questions(questions, documents, batch_size=8):
+    return get_engine().answer_questions(questions, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quantize', choices=QUANTIZATIONS, default='none', help="int8 runs the model dynamically quantized on the CPU")
+    parser.add_argument('--parity', action='store_true', help="compare int8 and full-precision answers to the questions below")
+    args = parser.parse_args()
+
+    questions = [
+        "What time does Computer Science 4490 start?",
+        "Who are the members of the Computer Science student council?",
+        "What is the average class size for upper-level Computer Science courses?",
+        "What types of extracurricular activities and clubs does the Computer Science department offer?",
+        "Who won the 2024 Faculty of Science Distinguished Research Professor Award?",
+        "What are the prerequisites for Computer Science 4447?",
+        "Who is the new Canada Research Chair in Data Analytics and Digital Health in Cognitive Aging and Dementia?",
+        "Do Computer Science students have acces to any free softwares?",
+        "What are some sources of the department's research grants from?",
+        "What Facilities does The Department of Computer Science occupy?",
+        "What is Computer Science 1025 about?",
+    ]
+    if args.parity:
+        print_parity(*parity_check(lambda quantize: create_engine(quantize, cache_db=None), questions))
+    else:
+        engine = create_engine(args.quantize)
+        answers = answer_questions(questions, engine.documents)
+        for question, answer in zip(questions, answers):
+            print(question, ": ", answer)
@@ -0,0 +1,81 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+#Answers are cached under the normalized question, the model configuration and the corpus
+#version (the BM25 index's corpus hash). New scraped data gives a new corpus version, so
+#old answers are never served for it.
+
+#Lowercase, collapse whitespace and drop surrounding punctuation
+def normalize_question(question):
+    return ' '.join(question.lower().split()).strip(' ?!.,;:')
+
+def cache_key(question, model_id, corpus_version):
+    text = '\0'.join([normalize_question(question), model_id, corpus_version])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    #In-memory LRU of up to capacity answers, backed by an optional SQLite file
+    def __init__(self, capacity=1024, db_path=None):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS answer_cache (
+                                    key TEXT PRIMARY KEY,
+                                    corpus_version TEXT,
+                                    answer TEXT,
+                                    created REAL
+                                )''')
+            self.conn.commit()
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    #Cached answer for the key, or None
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            if self.conn:
+                row = self.conn.execute('SELECT answer FROM answer_cache WHERE key = ?', (key,)).fetchone()
+                if row:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value, corpus_version):
+        with self.lock:
+            self._remember(key, value)
+            if self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO answer_cache (key, corpus_version, answer, created) VALUES (?, ?, ?, ?)',
+                                  (key, corpus_version, json.dumps(value), time.time()))
+                self.conn.commit()
+
+    #Drop every answer computed for an older corpus version
+    def purge(self, corpus_version):
+        with self.lock:
+            self.entries.clear()
+            if self.conn:
+                self.conn.execute('DELETE FROM answer_cache WHERE corpus_version != ?', (corpus_version,))
+                self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
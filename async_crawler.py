@@ -0,0 +1,149 @@
+import time
+import asyncio
+import aiohttp
+from robots_cache import shared_cache, host_of
+from crawl_state import NOT_MODIFIED
+
+#Concurrent, polite breadth-first crawler.
+#One aiohttp session pools the connections. Each host gets at most per_host requests in
+#flight and a token bucket spacing its requests by the robots.txt Crawl-delay (or by delay
+#when robots.txt sets none). robots.txt comes from the shared RobotsCache, so it is only
+#fetched when the cached copy is missing or expired.
+#With a CrawlState, pages are fetched with conditional GETs; a 304 Not Modified page is not
+#handed to handle_page again and its links are taken from the state instead.
+
+class TokenBucket:
+    #Allows rate requests per second, with bursts of up to capacity requests
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncCrawler:
+    #handle_page(url, page_html) scrapes a page and returns the links to follow from it
+    def __init__(self, handle_page, concurrency=8, per_host=4, delay=0.25, user_agent='*', max_pages=None, timeout=30, robots_cache=None, state=None):
+        self.handle_page = handle_page
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.delay = delay
+        self.user_agent = user_agent
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.robots_cache = robots_cache or shared_cache()
+        self.state = state
+        self.robots = {}
+        self.buckets = {}
+        self.host_locks = {}
+        self.seen = set()
+        self.visited = set()
+
+    #robots.txt policy and rate limiter of the URL's host
+    async def robots_for(self, session, url):
+        host = host_of(url)
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            if host not in self.robots:
+                rp = self.robots_cache.policy(host)
+                if rp is None:
+                    rp = await self.fetch_robots(session, host)
+                self.robots[host] = rp
+                delay = self.robots[host].crawl_delay(self.user_agent)
+                rate = 1 / delay if delay else (1 / self.delay if self.delay else float('inf'))
+                self.buckets[host] = TokenBucket(rate)
+        return self.robots[host], self.buckets[host]
+
+    #Fetch robots.txt for the host and store it in the robots cache
+    async def fetch_robots(self, session, host):
+        robots_url = f"{host}/robots.txt"
+        try:
+            async with session.get(robots_url) as response:
+                text = await response.text(errors='ignore') if response.status == 200 else ''
+                return self.robots_cache.store(host, response.status, text)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error occurred while fetching {robots_url}: {e}")
+            return self.robots_cache.store(host, 0)
+
+    #Send a request to the webpage and return (page_html, etag, last_modified).
+    #page_html is NOT_MODIFIED for a 304 answer to a conditional GET, None on failure.
+    async def get_page_content(self, session, url, bucket):
+        await bucket.acquire()
+        headers = self.state.conditional_headers(url) if self.state else None
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and self.state:
+                    self.state.record_not_modified(url)
+                    return NOT_MODIFIED, None, None
+                if response.status == 200:
+                    page_html = await response.text(errors='ignore')
+                    return page_html, response.headers.get('ETag'), response.headers.get('Last-Modified')
+                print(f"Failed to retrieve the page {url}. Status code: {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error occurred while fetching {url}: {e}")
+        return None, None, None
+
+    def enqueue(self, frontier, url):
+        if url not in self.seen:
+            self.seen.add(url)
+            frontier.put_nowait(url)
+
+    async def worker(self, session, frontier):
+        while True:
+            url = await frontier.get()
+            try:
+                if self.max_pages is not None and len(self.visited) >= self.max_pages:
+                    continue
+                rp, bucket = await self.robots_for(session, url)
+                if not rp.can_fetch(self.user_agent, url):
+                    continue
+                print(f"Visiting: {url}")
+                self.visited.add(url)
+                page_html, etag, last_modified = await self.get_page_content(session, url, bucket)
+                if page_html is NOT_MODIFIED:
+                    links = self.state.links(url, [])
+                elif page_html:
+                    links = set(self.handle_page(url, page_html) or ())
+                    if self.state:
+                        self.state.record(url, etag, last_modified, links=sorted(links))
+                else:
+                    links = ()
+                for link in links:
+                    self.enqueue(frontier, link)
+            except Exception as e:
+                print(f"Error occurred while scraping {url}: {e}")
+            finally:
+                frontier.task_done()
+
+    #Crawl breadth-first from the start URLs and return the set of visited URLs
+    async def crawl(self, start_urls):
+        frontier = asyncio.Queue()
+        for url in start_urls:
+            self.enqueue(frontier, url)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            workers = [asyncio.create_task(self.worker(session, frontier)) for _ in range(self.concurrency)]
+            await frontier.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.visited
+
+
+#Run a crawl from synchronous code
+def crawl(start_urls, handle_page, **options):
+    return asyncio.run(AsyncCrawler(handle_page, **options).crawl(start_urls))
@@ -0,0 +1,55 @@
+import re
+import time
+import argparse
+from corpus import load_documents
+from course_index import CourseCodeIndex
+from data_cleaning import clean_and_normalize_text, clean_texts
+from html_extract import parse_html, calendar_content, csd_content
+from bench_html_extract import sample_pages
+
+#Benchmark of the translate-based cleaning in data_cleaning against the re.sub version it
+#replaced, and of clean_texts over a process pool. Checks that the 'letters' profile gives the
+#same text as before and counts the course codes each profile leaves to look up.
+#    python bench_data_cleaning.py                     (text of the generated sample pages)
+#    python bench_data_cleaning.py --source scraped_info.jsonl
+
+#The cleaning the scrapers used before the profiles
+def regex_clean(text):
+    text = re.sub(r'[^a-zA-Z\s]', '', text)
+    return ' '.join(text.split())
+
+def sample_texts(copies):
+    texts = []
+    for kind, page_html, _ in sample_pages():
+        root = parse_html(page_html)
+        texts.append(csd_content(root)[1] if kind == 'csd' else calendar_content(root)[1])
+    return texts * copies
+
+def benchmark(texts, processes):
+    start = time.perf_counter()
+    expected = [regex_clean(text) for text in texts]
+    print(f"re.sub per document: {(time.perf_counter() - start) / len(texts) * 1e6:.1f} us per document")
+
+    start = time.perf_counter()
+    cleaned = [clean_and_normalize_text(text) for text in texts]
+    print(f"translate per document: {(time.perf_counter() - start) / len(texts) * 1e6:.1f} us per document")
+    print(f"  {'same' if cleaned == expected else 'DIFFERENT'} text")
+
+    start = time.perf_counter()
+    batched = clean_texts(texts, processes=processes)
+    print(f"clean_texts ({processes or 'all'} processes): {(time.perf_counter() - start) / len(texts) * 1e6:.1f} us per document")
+    print(f"  {'same' if batched == expected else 'DIFFERENT'} text")
+
+    for profile in ('letters', 'course_codes'):
+        index = CourseCodeIndex([{'title': '', 'content': text} for text in clean_texts(texts, profile, processes=1)])
+        print(f"{profile}: {len(index.content_postings)} course code keys found in the cleaned text")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', help='corpus to clean the content of (default: text of generated sample pages)')
+    parser.add_argument('--copies', type=int, default=200, help='copies of the sample page text')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    texts = [doc['content'] for doc in load_documents(args.source)] if args.source else sample_texts(args.copies)
+    benchmark(texts, args.processes)
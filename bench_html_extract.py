@@ -0,0 +1,149 @@
+import re
+import time
+import argparse
+import requests
+from bs4 import BeautifulSoup
+from urllib.parse import urljoin
+from html_extract import extract_csd_page, extract_calendar_page
+
+#Benchmark of the single lxml parse in html_extract against the BeautifulSoup path it replaced,
+#which parsed every page once per extract_* call. Checks that both give the same results.
+#    python bench_html_extract.py                      (generated sample pages)
+#    python bench_html_extract.py page.html https://csd.uwo.ca/...
+
+#The BeautifulSoup extraction the scrapers used before html_extract
+def soup_csd_content(page_html):
+    soup = BeautifulSoup(page_html, 'html.parser')
+    title_tag = soup.find('h1')
+    title = title_tag.get_text(strip=True) if title_tag else soup.find('title').get_text(strip=True) if soup.find('title') else "No Title Found"
+    content = ""
+    for element in soup.find_all(['h2', 'h3', 'p']):
+        if element.name in ['h2', 'h3']:
+            content += f"\n{element.get_text(strip=True)}\n"
+        elif element.name == 'p':
+            content += element.get_text(separator=' ', strip=True) + " "
+    content = re.sub(r'[\n\r\t]', ' ', content)
+    content = re.sub(r'[^\x00-\x7F]+', '', content)
+    content = re.sub(r'\s+', ' ', content)
+    return title, content.strip()
+
+def soup_csd_links(page_html, base_url):
+    soup = BeautifulSoup(page_html, 'html.parser')
+    links = set()
+    for link_tag in soup.find_all('a', href=True):
+        href = link_tag.get('href')
+        if href.startswith('#'):
+            continue
+        full_url = urljoin(base_url, href)
+        if base_url in full_url:
+            links.add(full_url)
+    return links
+
+def soup_calendar_content(page_html):
+    soup = BeautifulSoup(page_html, 'html.parser')
+    content_div = soup.find(id='CourseInformationDiv') or soup
+    content = content_div.get_text(separator=' ', strip=True)
+    titles = [tag.get_text(separator=' ', strip=True) for tag in content_div.find_all(['h2', 'h3'])]
+    if not titles:
+        titles.append("No Title Found")
+    return ' '.join(titles), content
+
+def soup_calendar_links(page_html, base_url):
+    soup = BeautifulSoup(page_html, 'html.parser')
+    links = set()
+    for row in soup.find_all('tr'):
+        dept_name_cell = row.find('a', class_='moduleDeptName')
+        if dept_name_cell and dept_name_cell.get_text() == "Computer Science":
+            for link_tag in row.find_all('a', href=True):
+                href = link_tag.get('href')
+                if href.startswith('#'):
+                    continue
+                links.add(urljoin(base_url, href))
+    return links
+
+def soup_more_details_links(page_html, base_url):
+    soup = BeautifulSoup(page_html, 'html.parser')
+    links = set()
+    for link_tag in soup.find_all('a', href=True):
+        if "More details" in link_tag.get_text():
+            links.add(urljoin(base_url, link_tag.get('href')))
+    return links
+
+def soup_csd_page(page_html, base_url):
+    title, content = soup_csd_content(page_html)
+    return title, content, soup_csd_links(page_html, base_url)
+
+def soup_calendar_page(page_html, base_url, more_details=False):
+    title, content = soup_calendar_content(page_html)
+    details = soup_more_details_links(page_html, base_url) if more_details else set()
+    return title, content, soup_calendar_links(page_html, base_url), details
+
+
+#Sample pages shaped like the csd.uwo.ca pages and the calendar's course listing and course pages
+def sample_pages():
+    base_url = "https://csd.uwo.ca"
+    nav = ''.join(f'<li><a href="/people/{i}">Person {i}</a></li>' for i in range(120))
+    paragraphs = ''.join(f'<h2>Section {i}</h2><p>Research in <b>area {i}</b> covers <a href="/research/{i}">topics</a> '
+                         f'such as machine learning, systems and theory.\n  Students’ projects run all year.</p>' for i in range(60))
+    csd_page = (f'<html><head><title>Computer Science</title><script>var x = "<p>";</script></head><body>'
+                f'<nav><ul>{nav}</ul></nav><h1>Computer Science - Western University</h1>{paragraphs}'
+                f'<!-- footer --><footer><p>&copy; Western University</p><a href="#top">Top</a></footer></body></html>')
+
+    calendar_url = "https://westerncalendar.uwo.ca/"
+    rows = ''.join(f'<tr><td><a class="moduleDeptName" href="Departments.cfm?D={i}">{"Computer Science" if i % 3 == 0 else "Mathematics"}</a></td>'
+                   f'<td><a href="Modules.cfm?ModuleID={i}">Honours Specialization {i}</a></td></tr>' for i in range(150))
+    courses = ''.join(f'<div class="panel"><h4>COMPSCI {1000 + i}A/B</h4><p>Course {i} description.</p>'
+                      f'<a class="btn" href="Courses.cfm?CourseAcadCalendarID=MAIN_{i}&amp;SelectedCalendar=Live">More details</a></div>' for i in range(120))
+    listing_page = f'<html><head><title>Courses</title></head><body><table>{rows}</table>{courses}</body></html>'
+
+    course_page = ('<html><head><title>Course</title></head><body><div id="Menu">' + nav + '</div>'
+                   '<div id="CourseInformationDiv"><h2>Computer Science 4447A/B</h2><h3>Course description</h3>'
+                   + '<p>Prerequisites and antirequisites apply.</p>' * 40 + '<strong>Extra Information:</strong> 3 lecture hours.</div></body></html>')
+
+    return [('csd', csd_page, base_url),
+            ('calendar listing', listing_page, calendar_url),
+            ('calendar course', course_page, calendar_url)]
+
+def load_pages(sources):
+    pages = []
+    for source in sources:
+        if source.startswith('http'):
+            page_html = requests.get(source, timeout=30).text
+            base_url = source
+        else:
+            with open(source, 'r', encoding='utf-8', errors='ignore') as f:
+                page_html = f.read()
+            base_url = "https://csd.uwo.ca"
+        kind = 'calendar' if 'westerncalendar' in source or 'CourseInformationDiv' in page_html or 'moduleDeptName' in page_html else 'csd'
+        pages.append((kind, page_html, base_url))
+    return pages
+
+def run(extract, kind, page_html, base_url):
+    if kind == 'csd':
+        return extract[0](page_html, base_url)
+    return extract[1](page_html, base_url, True)
+
+def benchmark(pages, repeat):
+    paths = {'BeautifulSoup, one parse per call': (soup_csd_page, soup_calendar_page),
+             'lxml, single parse': (extract_csd_page, extract_calendar_page)}
+    results = {}
+    for name, extract in paths.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs = [run(extract, kind.split()[0], page_html, base_url) for kind, page_html, base_url in pages]
+        elapsed = time.perf_counter() - start
+        results[name] = outputs
+        print(f"{name}: {elapsed / (repeat * len(pages)) * 1000:.2f} ms per page")
+
+    soup_outputs, lxml_outputs = results.values()
+    for (kind, _, _), a, b in zip(pages, soup_outputs, lxml_outputs):
+        print(f"  {kind}: {'same' if a == b else 'DIFFERENT'} title, content and links")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages', nargs='*', help='HTML files or URLs (default: generated sample pages)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages) if args.pages else sample_pages()
+    benchmark(pages, args.repeat)
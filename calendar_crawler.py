@@ -0,0 +1,120 @@
+import time
+import requests
+from data_cleaning import clean_and_normalize_text
+from robots_cache import can_scrape
+from html_extract import extract_calendar_page
+from crawl_state import NOT_MODIFIED, conditional_get
+from scrape_pipeline import ScrapePipeline
+
+#Crawl of the Western academic calendar shared by westerncal_site_scraper (SQLite) and
+#json_western_cal_site_scraper (JSONL corpus), which only differ in where the pages are stored.
+#fetch_page and parse_page stay module level so the parser processes can unpickle them.
+
+#Send a request to the webpage and parse the content
+def get_page_content(url):
+    try:
+        response = requests.get(url)
+        if response.status_code == 200:
+            return response.text
+        else:
+            print(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
+            return None
+    except Exception as e:
+        print(f"Error occurred while fetching {url}: {e}")
+        return None
+
+#Crawl the calendar and scrape its pages through a ScrapePipeline: fetcher threads download
+#the pages, a process pool parses them and this thread hands the results to
+#store_batch(rows), rows being (url, title, content) tuples, batch_size pages at a time or
+#whatever has been scraped after flush_every seconds, so stored pages show up during the crawl.
+#With a CrawlState pages are fetched with conditional GETs and only new or changed pages are stored.
+def crawl_domain(start_url, base_url, store_batch, state=None, fetchers=4, parsers=None, delay=1, batch_size=50, flush_every=5.0, profile='course_codes'):
+    course_page = "https://westerncalendar.uwo.ca/Courses.cfm?Subject=COMPSCI&SelectedCalendar=Live&ArchiveID="
+    start_urls = [start_url, course_page]
+    pipeline = ScrapePipeline(fetch_page, parse_page, fetchers=fetchers, parsers=parsers, delay=delay)
+    visited = set()
+    unique_links = set()
+    queued = {}
+    start_pages = {}
+    batch = []
+    batch_started = time.monotonic()
+
+    #Only the start pages and "More details" pages are followed; the other links are just scraped
+    def visit(url, follow):
+        if queued.get(url) is True or (url in queued and not follow) or not can_scrape(url):
+            return
+        queued[url] = follow
+        headers = state.conditional_headers(url) if state else None
+        pipeline.add(url, (base_url, follow, follow and "Courses.cfm" in url, headers, profile))
+
+    def store(url, title, content):
+        nonlocal batch_started
+        if state is None or state.is_changed(url, title, content):
+            if not batch:
+                batch_started = time.monotonic()
+            batch.append((url, title, content))
+            if state:
+                state.record(url, title=title, content=content)
+
+    for url in start_urls:
+        visit(url, True)
+
+    for url, (_, follow, _, _, _), (page_html, etag, last_modified), parsed in pipeline.run():
+        links = more_details_links = ()
+        if page_html is NOT_MODIFIED:
+            state.record_not_modified(url)
+            if follow:
+                found = state.links(url, {})
+                links, more_details_links = found.get('links', []), found.get('more_details', [])
+        elif parsed:
+            title, content, links, more_details_links = parsed
+            #Stored at the end if a page links back to it; its validators wait until then too,
+            #so a crawl state committed with an earlier batch doesn't skip it next time
+            deferred = content is not None and url not in unique_links and url in start_urls
+            if deferred:
+                start_pages[url] = (title, content, etag, last_modified)
+            if state:
+                state.record(url, None if deferred else etag, None if deferred else last_modified,
+                             links={'links': sorted(links), 'more_details': sorted(more_details_links)} if follow else None)
+            if content is not None and url in unique_links:
+                store(url, title, content)
+
+        if follow:
+            print(f"Visiting: {url}")
+            visited.add(url)
+            unique_links.update(links)
+            unique_links.update(more_details_links)
+            for link in links:
+                visit(link, False)
+            for link in more_details_links:
+                visit(link, True)
+
+        if batch and (len(batch) >= batch_size or time.monotonic() - batch_started >= flush_every):
+            store_batch(batch)
+            batch = []
+
+    for url, (title, content, etag, last_modified) in start_pages.items():
+        if url in unique_links:
+            store(url, title, content)
+        if state:
+            state.record(url, etag, last_modified)
+    if batch:
+        store_batch(batch)
+    return visited, unique_links
+
+#Runs in the fetcher threads: fetch a page, conditionally when the crawl state had headers for it
+def fetch_page(url, task):
+    headers = task[3]
+    if headers is None:
+        return get_page_content(url), None, None
+    return conditional_get(url, headers)
+
+#Runs in the parser processes: title, cleaned content and links of a page.
+#The content is None when the page has no title or content.
+def parse_page(page_html, task):
+    base_url, follow, more_details, _, profile = task
+    title, content, links, more_details_links = extract_calendar_page(page_html, base_url, more_details)
+    if not follow:
+        links = more_details_links = set()
+    cleaned_content = clean_and_normalize_text(content, profile) if title and content else None
+    return title, cleaned_content, links, more_details_links
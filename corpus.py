@@ -0,0 +1,32 @@
+import os
+import json
+import sqlite3
+from jsonl_corpus import JSONLCorpus, CORPUS_FILE, index_path
+
+#Load scraped documents from the scraped_info.jsonl corpus (read lazily), a scraped_info.json
+#file or the scraped_info table in scraped_data.db
+def load_documents(source=CORPUS_FILE):
+    if source.endswith('.jsonl'):
+        return JSONLCorpus(source)
+    if source.endswith('.db'):
+        conn = sqlite3.connect(source)
+        rows = conn.execute('''SELECT title, content FROM scraped_info
+                               WHERE content IS NOT NULL ORDER BY id''').fetchall()
+        conn.close()
+        return [{'title': title or '', 'content': content} for title, content in rows]
+
+    with open(source, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    return [item for item in data if 'content' in item]
+
+#Fingerprint of the source file, used to detect a stale index. A database in WAL mode takes new
+#commits in its -wal file and a JSONL corpus commits them in its sidecar, so those files count too.
+def source_fingerprint(source):
+    stat = os.stat(source)
+    fingerprint = {'source': os.path.abspath(source), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    for name, path in (('wal', f"{source}-wal"), ('sidecar', index_path(source))):
+        if os.path.exists(path):
+            extra_stat = os.stat(path)
+            fingerprint[f'{name}_mtime_ns'] = extra_stat.st_mtime_ns
+            fingerprint[f'{name}_size'] = extra_stat.st_size
+    return fingerprint
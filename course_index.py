@@ -0,0 +1,93 @@
+import re
+import bisect
+
+#Subject names used in the calendar and in questions, mapped to the calendar subject code
+SUBJECT_ALIASES = {
+    'computer science': 'COMPSCI',
+    'compsci': 'COMPSCI',
+}
+
+#e.g. "Computer Science 4447", "COMPSCI 4447A/B", "Computer Science 1025A/B/Y"
+COURSE_CODE_PATTERN = re.compile(r'\b(Computer Science|COMPSCI)\s*(\d{4})([A-Z](?:/[A-Z])*)?\b', re.IGNORECASE)
+
+#Normalized key for a course code, e.g. ("Computer Science", "4447", "a/b") -> "COMPSCI 4447A/B"
+def normalize_course_code(subject, number, suffix=''):
+    subject = SUBJECT_ALIASES.get(' '.join(subject.lower().split()), subject.upper())
+    return f"{subject} {number}{(suffix or '').upper()}"
+
+#Every key a mention should be found under: the bare code, each suffix letter and each leading
+#part of the suffix, so "4476A/B/Y" is found for "4476", "4476B", "4476A/B" and "4476A/B/Y"
+def course_code_variants(subject, number, suffix=''):
+    variants = {normalize_course_code(subject, number)}
+    if suffix:
+        letters = suffix.upper().split('/')
+        variants.update(normalize_course_code(subject, number, letter) for letter in letters)
+        variants.update(normalize_course_code(subject, number, '/'.join(letters[:i])) for i in range(2, len(letters) + 1))
+    return variants
+
+#Normalized course code mentioned in the question, or None
+def extract_course_code(question):
+    match = COURSE_CODE_PATTERN.search(question)
+    return normalize_course_code(*match.groups()) if match else None
+
+
+class CourseCodeIndex:
+    #Maps normalized course codes to the ids of the documents mentioning them, built once at load time.
+    #Title and content mentions are kept as separate posting lists.
+    def __init__(self, documents):
+        self.title_postings = {}
+        self.content_postings = {}
+        for doc_id, doc in enumerate(documents):
+            if doc is None:
+                #A passage removed by Passages.update()
+                continue
+            if isinstance(doc, dict):
+                self._add(self.title_postings, doc_id, doc.get('title') or '')
+                self._add(self.content_postings, doc_id, doc.get('content') or '')
+            else:
+                self._add(self.content_postings, doc_id, doc)
+
+    def _add(self, postings, doc_id, text):
+        for match in COURSE_CODE_PATTERN.finditer(text):
+            for key in course_code_variants(*match.groups()):
+                ids = postings.setdefault(key, [])
+                if not ids or ids[-1] < doc_id:
+                    ids.append(doc_id)
+                else:
+                    #A document re-indexed by update() goes back in its place
+                    i = bisect.bisect_left(ids, doc_id)
+                    if ids[i] != doc_id:
+                        ids.insert(i, doc_id)
+
+    #Index a document added to the corpus, re-index one whose content was replaced, or drop one
+    #that was removed (None)
+    def update(self, doc_id, doc):
+        for postings in (self.title_postings, self.content_postings):
+            for key in list(postings):
+                ids = postings[key]
+                i = bisect.bisect_left(ids, doc_id)
+                if i < len(ids) and ids[i] == doc_id:
+                    del ids[i]
+                    if not ids:
+                        del postings[key]
+        if doc is None:
+            return
+        self._add(self.title_postings, doc_id, doc.get('title') or '')
+        self._add(self.content_postings, doc_id, doc.get('content') or '')
+
+    #Sorted ids of the documents mentioning the course code in the given fields
+    def lookup(self, course_code, fields=('title', 'content')):
+        course_code = extract_course_code(course_code) or course_code
+        ids = set()
+        if 'title' in fields:
+            ids.update(self.title_postings.get(course_code, []))
+        if 'content' in fields:
+            ids.update(self.content_postings.get(course_code, []))
+        return sorted(ids)
+
+    #Documents to search for a question: the ones mentioning its course code, or None for the whole corpus
+    def lookup_question(self, question):
+        course_code = extract_course_code(question)
+        if course_code:
+            return self.lookup(course_code) or None
+        return None
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import requests
+
+#What the last crawl saw for each URL: the ETag / Last-Modified validators for conditional
+#GETs, a hash of the scraped title and content, and the page's links (so a page answered with
+#304 Not Modified still adds its links to the frontier).
+#Nothing is committed until the scraper calls commit() after storing its own data, so a crawl
+#that dies halfway refetches the pages it never stored.
+#The state belongs to the store the pages were written to (scraped_data.db or scraped_info.jsonl):
+#a page stored in one is still missing from the other, so each store keeps its own state file.
+
+#Crawl state file of a storage target
+def crawl_state_path(target):
+    return f"{target}.crawl_state"
+
+#Returned instead of the page HTML for a 304 Not Modified answer
+NOT_MODIFIED = object()
+
+#Hash of a scraped document, used to tell whether it changed since the last crawl
+def content_hash(title, content):
+    return hashlib.sha1(f"{title}\0{content}".encode('utf-8')).hexdigest()
+
+
+class CrawlState:
+    def __init__(self, target):
+        exists = os.path.exists(target)
+        self.conn = sqlite3.connect(crawl_state_path(target))
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS crawl_state (
+                                url TEXT PRIMARY KEY,
+                                etag TEXT,
+                                last_modified TEXT,
+                                content_hash TEXT,
+                                links TEXT,
+                                fetched REAL
+                            )''')
+        if not exists:
+            #The store was deleted (or never written), so nothing the state remembers is in it
+            self.conn.execute('DELETE FROM crawl_state')
+        self.conn.commit()
+        self.not_modified = 0
+        self.unchanged = 0
+        self.changed = 0
+
+    def _row(self, url):
+        return self.conn.execute('SELECT etag, last_modified, content_hash, links FROM crawl_state WHERE url = ?', (url,)).fetchone()
+
+    #If-None-Match / If-Modified-Since headers for a URL seen before
+    def conditional_headers(self, url):
+        row = self._row(url)
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    #Links found on the page the last time it was parsed, as they were passed to record()
+    def links(self, url, default=None):
+        row = self._row(url)
+        return json.loads(row[3]) if row and row[3] else default
+
+    #True if the scraped document is new or differs from the one stored last time
+    def is_changed(self, url, title, content):
+        row = self._row(url)
+        if row and row[2] == content_hash(title, content):
+            self.unchanged += 1
+            return False
+        self.changed += 1
+        return True
+
+    #Remember what was fetched for a URL; fields left as None keep their stored value
+    def record(self, url, etag=None, last_modified=None, title=None, content=None, links=None):
+        new_hash = content_hash(title, content) if content is not None else None
+        new_links = json.dumps(links) if links is not None else None
+        self.conn.execute('''INSERT INTO crawl_state (url, etag, last_modified, content_hash, links, fetched) VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(url) DO UPDATE SET
+                                etag = COALESCE(excluded.etag, crawl_state.etag),
+                                last_modified = COALESCE(excluded.last_modified, crawl_state.last_modified),
+                                content_hash = COALESCE(excluded.content_hash, crawl_state.content_hash),
+                                links = COALESCE(excluded.links, crawl_state.links),
+                                fetched = excluded.fetched''',
+                          (url, etag, last_modified, new_hash, new_links, time.time()))
+
+    #A 304 Not Modified answer: the stored copy is still current
+    def record_not_modified(self, url):
+        self.not_modified += 1
+        self.conn.execute('UPDATE crawl_state SET fetched = ? WHERE url = ?', (time.time(), url))
+
+    def commit(self):
+        self.conn.commit()
+
+    def summary(self):
+        return f"{self.changed} new or changed, {self.unchanged} unchanged, {self.not_modified} not modified (304)"
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+#Conditional GET of a page with the headers from CrawlState.conditional_headers().
+#Returns (page_html, etag, last_modified); page_html is NOT_MODIFIED for a 304 answer and None
+#if the page could not be fetched. Record the validators with state.record() once the page is stored.
+def conditional_get(url, headers=None):
+    try:
+        response = requests.get(url, headers=headers)
+        if response.status_code == 304:
+            return NOT_MODIFIED, None, None
+        if response.status_code == 200:
+            return response.text, response.headers.get('ETag'), response.headers.get('Last-Modified')
+        print(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
+    except Exception as e:
+        print(f"Error occurred while fetching {url}: {e}")
+    return None, None, None
@@ -1,128 +1,78 @@
-import requests
-from bs4 import BeautifulSoup
-import time
-import urllib.robotparser
-import re
-import sqlite3
-from urllib.parse import urljoin, urlparse
-import os  
-from data_cleaning import clean_and_normalize_text
-
-#Check if the URL can be scraped (robots.txt)
-def can_scrape(url):
-    rp = urllib.robotparser.RobotFileParser()
-    parsed_url = urlparse(url)
-    robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
-    rp.set_url(robots_url)
-    rp.read()
-    return rp.can_fetch("*", url)
-
-#Send a request to the webpage and parse the content
-def get_page_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text
-        else:
-            print(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error occurred while fetching {url}: {e}")
-        return None
+import argparse
+from data_cleaning import clean_and_normalize_text, PROFILES
+from scraped_store import open_db, store_pages, SCRAPED_DB, PageWriter
+from async_crawler import crawl
+from html_extract import parse_html, csd_content, csd_links, extract_csd_page
+from crawl_state import CrawlState
+from dedup import db_filter
 
 #Extract title and content
 def extract_content(page_html):
-    soup = BeautifulSoup(page_html, 'html.parser')
-    
-    title_tag = soup.find('h1')
-    title = title_tag.get_text(strip=True) if title_tag else soup.find('title').get_text(strip=True) if soup.find('title') else "No Title Found"
+    return csd_content(parse_html(page_html))
 
-    content = ""
-    for element in soup.find_all(['h2', 'h3', 'p']):
-        if element.name in ['h2', 'h3']:
-            content += f"\n{element.get_text(strip=True)}\n"
-        elif element.name == 'p':
-            content += element.get_text(separator=' ', strip=True) + " "
-    
-    content = re.sub(r'[\n\r\t]', ' ', content)
-    content = re.sub(r'[^\x00-\x7F]+', '', content)
-    content = re.sub(r'\s+', ' ', content)
-    return title, content.strip()
-
-#Crawl the domain and scrape pages
-def crawl_domain(start_url, conn):
-    visited = set()
-    pages_to_visit = [start_url]
-    
-    while pages_to_visit:
-        current_url = pages_to_visit.pop(0)
+#Crawl the domain and scrape pages, fetching concurrently with a per-host rate limit.
+#Pages are written to the database in batches. With a CrawlState only new or changed pages are written.
+#With an IngestFilter template text is stripped and near-duplicate pages are skipped.
+def crawl_domain(start_url, conn, concurrency=8, per_host=4, delay=0.25, state=None, profile='course_codes', ingest=None):
+    writer = PageWriter(conn, ingest=ingest)
 
-        if current_url in visited:
-            continue
+    def handle_page(current_url, page_html):
+        title, content, links = extract_csd_page(page_html, current_url)
+        if content:
+            cleaned_content = clean_and_normalize_text(content, profile)
+            if state is None or state.is_changed(current_url, title, cleaned_content):
+                writer.add(title, cleaned_content, current_url)
+                if state:
+                    state.record(current_url, title=title, content=cleaned_content)
+        return links
 
-        if can_scrape(current_url):
-            print(f"Visiting: {current_url}")
-            page_html = get_page_content(current_url)
-            if page_html:
-                title, content = extract_content(page_html)
-                if content:
-                    cleaned_content = clean_and_normalize_text(content)
-                    insert_data_to_db(conn, title, cleaned_content)
-                
-                links = extract_links(page_html, current_url)
-                pages_to_visit.extend(links)
-            
-            visited.add(current_url)
-        
-        time.sleep(1)
-    
+    visited = crawl([start_url], handle_page, concurrency=concurrency, per_host=per_host, delay=delay, state=state)
+    writer.flush()
+    if state:
+        state.commit()
     return visited
 
 #Extract links from a page
 def extract_links(page_html, base_url):
-    soup = BeautifulSoup(page_html, 'html.parser')
-    links = set()
-
-    for link_tag in soup.find_all('a', href=True):
-        href = link_tag.get('href')
-        if href.startswith('#'):
-            continue
-        full_url = urljoin(base_url, href)
-        if base_url in full_url:
-            links.add(full_url)
-    
-    return links
+    return csd_links(parse_html(page_html), base_url)
 
 #Create the SQLite database and table
 def create_db():
-    conn = sqlite3.connect('scraped_data.db')  
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS scraped_info (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT,
-                    content TEXT
-                )''')
-    conn.commit()
-    return conn
+    return open_db(SCRAPED_DB)
+
+#Insert data into the database, replacing the page's previous version when the URL is known
+def insert_data_to_db(conn, title, content, url=None):
+    store_pages(conn, [(url, title, content)])
 
-#Insert data into the database
-def insert_data_to_db(conn, title, content):
-    c = conn.cursor()
-    c.execute('''INSERT INTO scraped_info (title, content) 
-                 VALUES (?, ?)''', (title, content))
-    conn.commit()
+#Insert a batch of (url, title, content) rows in one transaction
+def insert_batch_to_db(conn, rows):
+    store_pages(conn, rows)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--full', action='store_true', help='Refetch every page instead of only new or changed ones')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='course_codes',
+                        help="Text cleaning profile; 'letters' drops digits, and with them course codes")
+    parser.add_argument('--keep-duplicates', action='store_true', help='Store near-duplicate pages and site template text as they are')
+    args = parser.parse_args()
+
     start_url = "https://csd.uwo.ca"
     
+    #Opened before the database, which creating it would make look like it was already there
+    state = None if args.full else CrawlState(SCRAPED_DB)
     #Create the SQLite database and table
     conn = create_db()
     
     #Start crawling and scraping the pages
-    visited_urls = crawl_domain(start_url, conn)
+    ingest = None if args.keep_duplicates else db_filter(conn)
+    visited_urls = crawl_domain(start_url, conn, state=state, profile=args.profile, ingest=ingest)
+    if ingest:
+        print(f"Ingest: {ingest.summary()}")
     
     #Close the connection to the database
     conn.close()
+    if state:
+        print(f"Pages: {state.summary()}")
+        state.close()
 
     print("Crawling finished and data has been stored in 'scraped_data.db'.")
@@ -1,13 +1,58 @@
-import re
+import os
+import string
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
-def clean_and_normalize_text(text):
+#Characters each cleaning profile keeps, besides whitespace.
+#'letters' is the original cleaning; 'course_codes' also keeps digits and slashes, so course
+#codes like "Computer Science 4447A/B" stay in the text and can be looked up.
+PROFILES = {
+    'letters': string.ascii_letters,
+    'course_codes': string.ascii_letters + string.digits + '/',
+}
+
+#Batches smaller than this are cleaned in the calling process
+MIN_PARALLEL = 256
+
+class TranslationTable(dict):
+    #str.translate table keeping the given characters, turning any whitespace into a space and
+    #deleting everything else. Characters outside ASCII are looked up once and remembered.
+    def __init__(self, keep):
+        super().__init__()
+        for code in range(128):
+            self._set(code, keep)
+        self.keep = keep
+
+    def _set(self, code, keep):
+        char = chr(code)
+        self[code] = char if char in keep else ' ' if char.isspace() else None
+
+    def __missing__(self, code):
+        self._set(code, self.keep)
+        return self[code]
+
+TABLES = {name: TranslationTable(keep) for name, keep in PROFILES.items()}
+
+def clean_and_normalize_text(text, profile='letters'):
     """
     Cleans and normalizes text by:
-    1. Removing special characters and numbers.
+    1. Removing special characters and numbers (numbers and slashes are kept with profile='course_codes').
     2. Removing extra whitespace.
     """
-    #Remove special characters and numbers (keep only letters and whitespace)
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
+    #One translate pass deletes the characters the profile doesn't keep
+    text = text.translate(TABLES[profile])
     #Remove extra whitespace
-    text = ' '.join(text.split())
-    return text
\ No newline at end of file
+    return ' '.join(text.split())
+
+def clean_texts(texts, profile='letters', processes=None, chunksize=64):
+    """
+    Cleans many texts in one call, spread over a pool of processes (one per core by default)
+    when there are enough of them.
+    Returns the cleaned texts in the same order.
+    """
+    texts = list(texts)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(texts) < MIN_PARALLEL:
+        return [clean_and_normalize_text(text, profile) for text in texts]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(partial(clean_and_normalize_text, profile=profile), texts, chunksize=chunksize))
@@ -0,0 +1,264 @@
+import os
+import zlib
+import numpy as np
+from collections import Counter
+from robots_cache import host_of
+from jsonl_corpus import JSONLCorpus, document_key, encode_document, build_sidecar, CORPUS_FILE
+
+#Ingest-time cleanup of scraped pages, before they reach the corpus and the index.
+#Site-wide template text (the csd.uwo.ca footer with its address and "Privacy | Web Standards |
+#Terms of Use | Accessibility" links) is stripped, and pages that are near-duplicates of a page
+#already stored under another URL are dropped. Near-duplicates are found with MinHash signatures
+#of word shingles and LSH banding, so a new page is only compared with a few candidates.
+
+#Words per shingle for near-duplicate detection and for template detection
+SHINGLE_WORDS = 5
+TEMPLATE_SHINGLE_WORDS = 8
+
+#128 hash functions in 16 bands of 8 rows: pages with a Jaccard similarity of 0.9 share a band
+#with probability > 0.9999, unrelated pages almost never
+NUM_PERM = 128
+BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+#Stable 32-bit hashes of the distinct k-word shingles of a text
+def shingle_hashes(words, k):
+    if len(words) <= k:
+        shingles = {' '.join(words)} if words else set()
+    else:
+        shingles = {' '.join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.array(sorted(zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64)
+
+
+class MinHasher:
+    #MinHash signatures from random linear hash functions, the same for every run
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self.b = generator.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self.num_perm = num_perm
+
+    def signature(self, hashes):
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        return (((self.a * hashes + self.b) % MERSENNE_PRIME) & MAX_HASH).min(axis=1)
+
+
+#Share of equal signature values, an estimate of the Jaccard similarity of the shingle sets
+def estimated_similarity(signature, other):
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+class LSHIndex:
+    #Signatures split into bands; documents sharing any band are candidates for a comparison
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def _band_keys(self, signature):
+        return [band.tobytes() for band in np.array_split(signature, self.bands)]
+
+    def add(self, key, signature):
+        self.remove(key)
+        self.signatures[key] = signature
+        for buckets, band_key in zip(self.buckets, self._band_keys(signature)):
+            buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for buckets, band_key in zip(self.buckets, self._band_keys(signature)):
+            keys = buckets[band_key]
+            keys.discard(key)
+            if not keys:
+                del buckets[band_key]
+
+    #Indexed documents sharing a band with the signature, most similar first, as (similarity, key)
+    def candidates(self, signature):
+        keys = set()
+        for buckets, band_key in zip(self.buckets, self._band_keys(signature)):
+            keys.update(buckets.get(band_key, ()))
+        return sorted(((estimated_similarity(signature, self.signatures[key]), key) for key in keys), reverse=True)
+
+
+class TemplateModel:
+    #Counts in how many pages of each site every 8-word shingle appears. A run of at least
+    #min_words words made of shingles found in min_fraction of a site's pages (and at least
+    #min_docs pages) is template text. Short repeated runs are kept: on the calendar they are
+    #shared facts like "3 lecture hours. Course Weight: 0.50" rather than page furniture.
+    def __init__(self, min_docs=5, min_fraction=0.1, min_words=25):
+        self.min_docs = min_docs
+        self.min_fraction = min_fraction
+        self.min_words = min_words
+        self.counts = {}
+        self.pages = Counter()
+
+    def add(self, site, words):
+        self.counts.setdefault(site, Counter()).update(shingle_hashes(words, TEMPLATE_SHINGLE_WORDS).tolist())
+        self.pages[site] += 1
+
+    #Words of the page with its template runs removed
+    def strip(self, site, words):
+        counts = self.counts.get(site)
+        k = TEMPLATE_SHINGLE_WORDS
+        if not counts or len(words) < self.min_words:
+            return words
+        min_count = max(self.min_docs, self.min_fraction * self.pages[site])
+        covered = np.zeros(len(words) + 1, dtype=np.int32)
+        for i in range(len(words) - k + 1):
+            if counts.get(zlib.crc32(' '.join(words[i:i + k]).encode('utf-8')), 0) >= min_count:
+                covered[i] += 1
+                covered[i + k] -= 1
+        covered = np.cumsum(covered[:-1]) > 0
+
+        kept = []
+        start = 0
+        while start < len(words):
+            end = start
+            while end < len(words) and covered[end] == covered[start]:
+                end += 1
+            if not covered[start] or end - start < self.min_words:
+                kept.extend(words[start:end])
+            start = end
+        return kept
+
+
+#Site a page belongs to; pages saved without a URL are counted together
+def page_site(doc):
+    return host_of(doc['url']) if doc.get('url') else ''
+
+def normalize_title(title):
+    return ' '.join((title or '').lower().split())
+
+
+class IngestFilter:
+    #Strips template text from scraped pages and drops near-duplicates of pages already stored.
+    #documents are the pages stored so far; the template model learns from them and from every
+    #page passed to filter(), so it keeps up with the crawl.
+    #A near-duplicate has the same title and an estimated similarity of at least threshold:
+    #different calendar courses can share one description and are all kept.
+    def __init__(self, documents=(), threshold=0.9, template_model=None, min_words=5):
+        self.threshold = threshold
+        self.templates = template_model or TemplateModel()
+        self.min_words = min_words
+        self.hasher = MinHasher()
+        self.lsh = LSHIndex()
+        self.titles = {}
+        self.names = {}
+        #Keys of the pages stored without a URL
+        self.without_url = set()
+        self.duplicates = 0
+        self.empty = 0
+        self.stripped_words = 0
+        documents = list(documents)
+        for doc in documents:
+            self.templates.add(page_site(doc), doc['content'].split())
+        for doc in documents:
+            words = self.templates.strip(page_site(doc), doc['content'].split())
+            self._index(doc, words)
+
+    def _index(self, doc, words, signature=None):
+        key = document_key(doc)
+        if signature is None:
+            signature = self.hasher.signature(shingle_hashes(words, SHINGLE_WORDS))
+        self.lsh.add(key, signature)
+        self.titles[key] = normalize_title(doc.get('title'))
+        self.names[key] = doc.get('url') or doc.get('title')
+        if not doc.get('url'):
+            self.without_url.add(key)
+
+    #The page with its template text stripped, or None if it is a near-duplicate of another
+    #stored page (a page saved again under its own URL isn't, nor is a page with a URL that was
+    #stored without one before, which the store replaces) or has fewer than min_words
+    #words of its own left. learn=False leaves the template model as it is.
+    def filter(self, doc, learn=True):
+        site = page_site(doc)
+        words = doc['content'].split()
+        if learn:
+            self.templates.add(site, words)
+        kept = self.templates.strip(site, words)
+        self.stripped_words += len(words) - len(kept)
+        if len(kept) < self.min_words:
+            self.empty += 1
+            return None
+
+        key = document_key(doc)
+        title = normalize_title(doc.get('title'))
+        signature = self.hasher.signature(shingle_hashes(kept, SHINGLE_WORDS))
+        for similarity, other in self.lsh.candidates(signature):
+            if similarity < self.threshold:
+                break
+            if other != key and self.titles[other] == title and not (doc.get('url') and other in self.without_url):
+                self.duplicates += 1
+                print(f"Skipping {doc.get('url') or doc.get('title')}: near-duplicate of {self.names[other]}")
+                return None
+        self._index(doc, kept, signature)
+        if len(kept) == len(words):
+            return doc
+        return dict(doc, content=' '.join(kept))
+
+    #filter() for (url, title, content) rows, as the scrapers store them
+    def filter_rows(self, rows):
+        kept = []
+        for url, title, content in rows:
+            doc = self.filter({'title': title, 'content': content, 'url': url})
+            if doc is not None:
+                kept.append((url, title, doc['content']))
+        return kept
+
+    def summary(self):
+        return (f"{self.duplicates} near-duplicates and {self.empty} pages without text of their own dropped, "
+                f"{self.stripped_words} template words stripped")
+
+#Filter for a scraper appending to a JSONL corpus, primed with the pages already in it
+def corpus_filter(path=CORPUS_FILE, threshold=0.9):
+    if not os.path.exists(path):
+        return IngestFilter(threshold=threshold)
+    corpus = JSONLCorpus(path)
+    ingest = IngestFilter(corpus, threshold)
+    corpus.close()
+    return ingest
+
+#Filter for a scraper writing to the database, primed with the pages already stored
+def db_filter(conn, threshold=0.9):
+    rows = conn.execute('SELECT url, title, content FROM scraped_info WHERE content IS NOT NULL ORDER BY id').fetchall()
+    return IngestFilter([{'title': title or '', 'content': content, 'url': url} for url, title, content in rows], threshold)
+
+#Rewrite a corpus with template text stripped and near-duplicates dropped. The template model
+#sees every page before any is stripped, so the first pages are cleaned like the rest.
+def dedup_corpus(path, output, threshold=0.9):
+    corpus = JSONLCorpus(path)
+    templates = TemplateModel()
+    for doc in corpus:
+        templates.add(page_site(doc), doc['content'].split())
+    ingest = IngestFilter(threshold=threshold, template_model=templates)
+    kept = 0
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for doc in corpus:
+            doc = ingest.filter(doc, learn=False)
+            if doc is not None:
+                f.write(encode_document(doc))
+                kept += 1
+        f.flush()
+        os.fsync(f.fileno())
+    total = len(corpus)
+    corpus.close()
+    os.replace(tmp_path, output)
+    build_sidecar(output)
+    return total, kept, ingest
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Strip template text and drop near-duplicate pages from a JSONL corpus")
+    parser.add_argument('--source', default=CORPUS_FILE)
+    parser.add_argument('--output', help="corpus to write (default: replace the source)")
+    parser.add_argument('--threshold', type=float, default=0.9, help="estimated Jaccard similarity of a near-duplicate")
+    args = parser.parse_args()
+
+    total, kept, ingest = dedup_corpus(args.source, args.output or args.source, args.threshold)
+    print(f"Kept {kept} of {total} documents: {ingest.summary()}.")
@@ -0,0 +1,294 @@
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+from transformers import AutoModel
+from model_loader import load_cached
+from corpus import source_fingerprint, CORPUS_FILE
+from jsonl_corpus import JSONLCorpus, sidecar_digest
+from passages import Passages, load_passages
+from retrieval_index import save_array, save_json
+from qa_batching import length_order, restore_order
+
+#Dense retrieval alongside BM25.
+#Every passage (see passages.py) is embedded once with a small sentence-embedding model on the
+#CPU. The embeddings are saved as a memory-mapped float16 matrix, grouped into IVF lists (k-means
+#clusters), so a query only scores the passages of its nprobe nearest clusters. HybridIndex
+#fuses the dense ranking with the BM25 ranking by reciprocal rank fusion, which finds pages
+#whose words differ from the question's ("free softwares" vs "software available to students").
+
+DENSE_INDEX_DIR = 'dense_index'
+DENSE_INDEX_VERSION = 2
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+#Corpora smaller than this are searched exhaustively (one IVF list)
+MIN_IVF_DOCS = 1024
+NPROBE = 8
+
+#Reciprocal rank fusion: score = sum of 1 / (RRF_K + rank) over the rankings, each FUSION_DEPTH deep
+RRF_K = 60
+FUSION_DEPTH = 50
+
+#Text a passage is embedded from; the page title places a passage from the middle of a page
+def document_text(doc):
+    if isinstance(doc, dict):
+        return f"{doc.get('title') or ''}. {doc['content']}"
+    return doc
+
+
+class SentenceEncoder:
+    #Mean-pooled, normalized embeddings from a transformers model, in length-sorted batches
+    def __init__(self, model=EMBEDDING_MODEL, max_tokens=256, batch_size=32):
+        self.model_name = model
+        self.tokenizer, self.model = load_cached(AutoModel, model)
+        self.model.eval()
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size
+        self.dim = self.model.config.hidden_size
+
+    def encode(self, texts):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        order = length_order(texts)
+        embeddings = []
+        for start in range(0, len(order), self.batch_size):
+            batch = self.tokenizer([texts[i] for i in order[start:start + self.batch_size]], padding=True,
+                                   truncation=True, max_length=self.max_tokens, return_tensors='pt')
+            with torch.inference_mode():
+                hidden = self.model(**batch).last_hidden_state
+            mask = batch['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            embeddings.extend(torch.nn.functional.normalize(pooled, dim=-1).numpy())
+        return np.array(restore_order(order, embeddings), dtype=np.float32)
+
+
+#Spherical k-means: centroids of unit vectors, compared by dot product
+def kmeans(vectors, nlist, iterations=10, seed=0):
+    generator = np.random.RandomState(seed)
+    centroids = vectors[generator.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = vectors[assignment == cluster]
+            #An empty cluster keeps its centroid
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+#Embed the documents and save the IVF index to index_dir
+def build_dense_index(documents, encoder, index_dir=DENSE_INDEX_DIR, source=None):
+    corpus_hash = hashlib.sha1()
+    texts = []
+    for doc in documents:
+        texts.append(document_text(doc))
+        corpus_hash.update(texts[-1].encode('utf-8'))
+        corpus_hash.update(b'\0')
+    embeddings = encoder.encode(texts)
+
+    if len(embeddings) >= MIN_IVF_DOCS:
+        centroids = kmeans(embeddings, int(np.sqrt(len(embeddings))))
+        assignment = np.argmax(embeddings @ centroids.T, axis=1)
+    else:
+        centroids = np.zeros((1, encoder.dim), dtype=np.float32)
+        assignment = np.zeros(len(embeddings), dtype=np.int64)
+    #Rows grouped by list, so every list is one contiguous slice of the matrix
+    row_ids = np.argsort(assignment, kind='stable').astype(np.int32)
+    list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+
+    os.makedirs(index_dir, exist_ok=True)
+    save_array(os.path.join(index_dir, 'vectors.npy'), embeddings[row_ids].astype(np.float16))
+    save_array(os.path.join(index_dir, 'row_ids.npy'), row_ids)
+    save_array(os.path.join(index_dir, 'centroids.npy'), centroids.astype(np.float32))
+    save_array(os.path.join(index_dir, 'list_offsets.npy'), list_offsets)
+
+    #meta.json is written last so a half-written index is never loaded
+    meta = {
+        'version': DENSE_INDEX_VERSION,
+        'model': encoder.model_name,
+        'corpus_size': len(texts),
+        'corpus_hash': corpus_hash.hexdigest(),
+        'fingerprint': source_fingerprint(source) if source else None,
+    }
+    if isinstance(documents, Passages):
+        meta['passages'] = documents.params
+        if source and isinstance(documents.documents, JSONLCorpus):
+            meta['lines'] = documents.lines
+            meta['sidecar_digest'] = sidecar_digest(source, documents.lines)
+    save_json(os.path.join(index_dir, 'meta.json'), meta)
+    return meta
+
+def _read_meta(index_dir):
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+#Load the dense index of the passages, rebuilding it if it was built from other passages or with
+#another model. Passage ids depend on the order pages were updated in, so for a JSONL corpus the
+#saved index is built from the corpus lines the live BM25 index was built from (lines), and the
+#passages changed since are embedded in memory, as load_live_index adds them to BM25. spans are
+#the spans of the passages of those lines, when the BM25 index has them (see load_spans).
+def load_dense_index(documents, encoder, source=CORPUS_FILE, index_dir=DENSE_INDEX_DIR, lines=None, spans=None):
+    meta = _read_meta(index_dir)
+    usable = (meta.get('version') == DENSE_INDEX_VERSION and meta.get('model') == encoder.model_name
+              and meta.get('passages') == documents.params)
+    if isinstance(documents.documents, JSONLCorpus):
+        lines = documents.lines if lines is None else lines
+        indexed = Passages(JSONLCorpus(source, lines), documents.max_words, documents.overlap, spans)
+        if not (usable and meta.get('lines') == lines and sidecar_digest(source, lines) == meta.get('sidecar_digest')):
+            print(f"Building dense index for {source} in {index_dir}")
+            build_dense_index(indexed, encoder, index_dir, source)
+        index = DenseIndex(index_dir, encoder)
+        changed = indexed.update(documents.lines)
+        if changed:
+            index.add_documents(changed, [indexed[i] for i in changed])
+        indexed.close()
+        return index
+
+    if not (usable and meta.get('fingerprint') == source_fingerprint(source)):
+        print(f"Building dense index for {source} in {index_dir}")
+        build_dense_index(documents, encoder, index_dir, source)
+    return DenseIndex(index_dir, encoder)
+
+
+class DenseIndex:
+    #Memory-maps a saved dense index. Documents added or changed after it was built are embedded
+    #and kept in memory, and searched exhaustively next to the IVF lists.
+    def __init__(self, index_dir=DENSE_INDEX_DIR, encoder=None, nprobe=NPROBE):
+        self.index_dir = index_dir
+        self.encoder = encoder
+        self.nprobe = nprobe
+        self.meta = _read_meta(index_dir)
+        self.corpus_size = self.meta['corpus_size']
+        self.corpus_hash = self.meta['corpus_hash']
+        self.vectors = self._load('vectors.npy')
+        self.row_ids = self._load('row_ids.npy')
+        self.centroids = np.load(os.path.join(index_dir, 'centroids.npy'))
+        self.list_offsets = np.load(os.path.join(index_dir, 'list_offsets.npy'))
+        #Row of every saved document, for scoring a given set of documents
+        self.rows = np.empty(self.corpus_size, dtype=np.int64)
+        self.rows[self.row_ids] = np.arange(self.corpus_size)
+        self.added = {}
+
+    def _load(self, name):
+        return np.load(os.path.join(self.index_dir, name), mmap_mode='r')
+
+    #Embed new documents, or documents whose content changed; new ones take the next ids.
+    #Removed documents (None) are left out of the search.
+    def add_documents(self, doc_ids, docs):
+        texts = [document_text(doc) for doc in docs if doc is not None]
+        embeddings = iter(self.encoder.encode(texts))
+        corpus_hash = hashlib.sha1(self.corpus_hash.encode('utf-8'))
+        for doc_id, doc in zip(doc_ids, docs):
+            self.corpus_size = max(self.corpus_size, doc_id + 1)
+            if doc is None:
+                self.added[doc_id] = None
+                corpus_hash.update(f"{doc_id}\1".encode('utf-8'))
+            else:
+                self.added[doc_id] = next(embeddings)
+                corpus_hash.update(f"{doc_id}\0{document_text(doc)}\0".encode('utf-8'))
+        self.corpus_hash = corpus_hash.hexdigest()
+
+    #Dot products of the query with the given saved rows, leaving out documents replaced since
+    def _score_rows(self, query, rows):
+        ids = self.row_ids[rows].astype(np.int64)
+        scores = self.vectors[rows].astype(np.float32) @ query
+        if self.added:
+            keep = ~np.isin(ids, np.fromiter(self.added, dtype=np.int64, count=len(self.added)))
+            ids, scores = ids[keep], scores[keep]
+        return ids, scores
+
+    def _score_added(self, query, doc_ids=None):
+        ids = [doc_id for doc_id, embedding in self.added.items()
+               if embedding is not None and (doc_ids is None or doc_id in doc_ids)]
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.array(ids, dtype=np.int64), np.array([self.added[doc_id] for doc_id in ids]) @ query
+
+    #Ids and similarities of the best documents for an embedded query, best first
+    def search_vector(self, query, top_n=3, doc_ids=None):
+        if doc_ids is None:
+            nearest = np.argsort(-(self.centroids @ query), kind='stable')[:self.nprobe]
+            rows = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in nearest])
+            ids, scores = self._score_rows(query, np.sort(rows))
+            added_ids, added_scores = self._score_added(query)
+        else:
+            doc_ids = set(int(doc_id) for doc_id in doc_ids)
+            saved = np.array(sorted(doc_id for doc_id in doc_ids if doc_id < len(self.rows)), dtype=np.int64)
+            ids, scores = self._score_rows(query, np.sort(self.rows[saved]))
+            added_ids, added_scores = self._score_added(query, doc_ids)
+        ids = np.concatenate([ids, added_ids])
+        scores = np.concatenate([scores, added_scores])
+        order = np.lexsort((ids, -scores))[:top_n]
+        return ids[order].tolist(), scores[order].tolist()
+
+    #Top document ids for each question text; doc_ids holds each question's filtered documents or None
+    def search_many(self, queries, top_n=3, doc_ids=None):
+        if doc_ids is None:
+            doc_ids = [None] * len(queries)
+        embeddings = self.encoder.encode(queries)
+        return [self.search_vector(query, top_n, ids)[0] for query, ids in zip(embeddings, doc_ids)]
+
+
+#Fuse rankings (lists of document ids, best first) by reciprocal rank fusion
+def reciprocal_rank_fusion(rankings, top_n, k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    #Ties keep the order in which the documents were first ranked
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])[:top_n]
+
+
+class HybridIndex:
+    #BM25 and dense retrieval fused by reciprocal rank fusion, searched like a BM25Index.
+    #Only documents matching a query term take part from the BM25 side; the dense side ranks
+    #FUSION_DEPTH documents for every query, so a question with no matching terms still finds pages.
+    def __init__(self, bm25, dense, depth=FUSION_DEPTH):
+        self.bm25 = bm25
+        self.dense = dense
+        self.depth = depth
+
+    @property
+    def corpus_size(self):
+        return self.bm25.corpus_size
+
+    @property
+    def corpus_hash(self):
+        return self.bm25.corpus_hash
+
+    def add_documents(self, doc_ids, docs):
+        self.bm25.add_documents(doc_ids, docs)
+        self.dense.add_documents(doc_ids, docs)
+
+    #queries are the question texts the encoder embeds; without them the tokens are joined
+    def search_many(self, queries_tokens, top_n=3, doc_ids=None, queries=None):
+        if doc_ids is None:
+            doc_ids = [None] * len(queries_tokens)
+        if queries is None:
+            queries = [' '.join(tokens) for tokens in queries_tokens]
+        depth = max(top_n, self.depth)
+        dense = self.dense.search_many(queries, depth, doc_ids)
+        results = []
+        for tokens, ids, dense_ranking in zip(queries_tokens, doc_ids, dense):
+            lexical_ranking = self.bm25.matching(tokens, depth, ids)
+            results.append(reciprocal_rank_fusion([lexical_ranking, dense_ranking], top_n))
+        return results
+
+    def search(self, query_tokens, top_n=3, doc_ids=None, query=None):
+        return self.search_many([query_tokens], top_n, [doc_ids], None if query is None else [query])[0]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Embed the corpus and build the dense index")
+    parser.add_argument('--source', default=CORPUS_FILE)
+    parser.add_argument('--model', default=EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    meta = build_dense_index(load_passages(args.source), SentenceEncoder(args.model), DENSE_INDEX_DIR, args.source)
+    print(f"Embedded {meta['corpus_size']} passages from {args.source} into {DENSE_INDEX_DIR}")
@@ -0,0 +1,122 @@
+from urllib.parse import urljoin
+import lxml.html
+from lxml import etree
+
+#Single-parse page extraction for the scrapers.
+#Each page is parsed once with lxml and the title, content and links are all read from that
+#one tree, giving the same results as the BeautifulSoup extract_content / extract_links /
+#extract_more_details_links functions, which each parsed the page again.
+
+#Strings BeautifulSoup's get_text() leaves out (scripts, stylesheets, templates, ruby text)
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+
+#Parse a page into an lxml tree
+def parse_html(page_html):
+    try:
+        return lxml.html.document_fromstring(page_html)
+    except ValueError:
+        #A str with an XML encoding declaration has to be parsed as bytes
+        return lxml.html.document_fromstring(page_html.encode('utf-8'))
+    except etree.ParserError:
+        #Empty document
+        return lxml.html.document_fromstring('<html><body></body></html>')
+
+def _strings(element):
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in SKIPPED_TEXT_TAGS:
+            yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+#Text of an element, like BeautifulSoup's get_text(separator, strip)
+def element_text(element, separator='', strip=False):
+    if strip:
+        return separator.join(text for text in (s.strip() for s in _strings(element)) if text)
+    return separator.join(_strings(element))
+
+def _first(root, tag):
+    return next(root.iter(tag), None)
+
+
+#Title and content of a csd.uwo.ca page: the h1 (or <title>) and the h2/h3/p text
+def csd_content(root):
+    title_tag = _first(root, 'h1')
+    if title_tag is None:
+        title_tag = _first(root, 'title')
+    title = element_text(title_tag, strip=True) if title_tag is not None else "No Title Found"
+
+    parts = []
+    for element in root.iter('h2', 'h3', 'p'):
+        if element.tag == 'p':
+            parts.append(element_text(element, separator=' ', strip=True) + " ")
+        else:
+            parts.append(f"\n{element_text(element, strip=True)}\n")
+    content = ''.join(parts)
+
+    #Drop non-ASCII characters and collapse whitespace (newlines, tabs, runs of spaces) to single spaces
+    content = content.encode('ascii', 'ignore').decode('ascii')
+    return title, ' '.join(content.split())
+
+#Links on a csd.uwo.ca page that stay under base_url
+def csd_links(root, base_url):
+    links = set()
+    for link_tag in root.iter('a'):
+        href = link_tag.get('href')
+        if href is None or href.startswith('#'):
+            continue
+        full_url = urljoin(base_url, href)
+        if base_url in full_url:
+            links.add(full_url)
+    return links
+
+#Title, content and links of a csd.uwo.ca page from a single parse
+def extract_csd_page(page_html, base_url):
+    root = parse_html(page_html)
+    title, content = csd_content(root)
+    return title, content, csd_links(root, base_url)
+
+
+#Title and content of a calendar page, read from the div with id "CourseInformationDiv"
+def calendar_content(root):
+    matches = root.xpath('//*[@id="CourseInformationDiv"]')
+    content_div = matches[0] if matches else root
+    content = element_text(content_div, separator=' ', strip=True)
+    titles = [element_text(tag, separator=' ', strip=True) for tag in content_div.iter('h2', 'h3')]
+    if not titles:
+        titles.append("No Title Found")
+    return ' '.join(titles), content
+
+def _has_class(element, name):
+    classes = element.get('class')
+    return classes is not None and (classes == name or name in classes.split())
+
+#Links in the table rows of the Computer Science department on a calendar page
+def calendar_links(root, base_url):
+    links = set()
+    for row in root.iter('tr'):
+        dept_name_cell = next((a for a in row.iter('a') if _has_class(a, 'moduleDeptName')), None)
+        if dept_name_cell is not None and element_text(dept_name_cell) == "Computer Science":
+            for link_tag in row.iter('a'):
+                href = link_tag.get('href')
+                if href is None or href.startswith('#'):
+                    continue
+                links.add(urljoin(base_url, href))
+    return links
+
+#"More details" links of a calendar course listing
+def more_details_links(root, base_url):
+    links = set()
+    for link_tag in root.iter('a'):
+        href = link_tag.get('href')
+        if href is not None and "More details" in element_text(link_tag):
+            links.add(urljoin(base_url, href))
+    return links
+
+#Title, content, links and "More details" links of a calendar page from a single parse
+def extract_calendar_page(page_html, base_url, more_details=False):
+    root = parse_html(page_html)
+    title, content = calendar_content(root)
+    details = more_details_links(root, base_url) if more_details else set()
+    return title, content, calendar_links(root, base_url), details
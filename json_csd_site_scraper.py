@@ -1,114 +1,66 @@
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
-from urllib.parse import urljoin, urlparse
-import urllib.robotparser
-import re
-import os
-from data_cleaning import clean_and_normalize_text
-
-#Check if the URL can be scraped (robots.txt)
-def can_scrape(url):
-    rp = urllib.robotparser.RobotFileParser()
-    parsed_url = urlparse(url)
-    robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
-    rp.set_url(robots_url)
-    rp.read()
-    return rp.can_fetch("*", url)
-
-#Send a request to the webpage and parse the content
-def get_page_content(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text
-        else:
-            print(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error occurred while fetching {url}: {e}")
-        return None
+import argparse
+from data_cleaning import clean_and_normalize_text, PROFILES
+from jsonl_corpus import append_documents, CorpusWriter, CORPUS_FILE
+from async_crawler import crawl
+from html_extract import parse_html, csd_content, extract_csd_page
+from crawl_state import CrawlState
+from dedup import corpus_filter
 
 #Extract title and content
 def extract_content(page_html):
-    soup = BeautifulSoup(page_html, 'html.parser')
-    
-    title_tag = soup.find('h1')
-    title = title_tag.get_text(strip=True) if title_tag else soup.find('title').get_text(strip=True) if soup.find('title') else "No Title Found"
+    return csd_content(parse_html(page_html))
 
-    content = ""
-    for element in soup.find_all(['h2', 'h3', 'p']):
-        if element.name in ['h2', 'h3']:
-            content += f"\n{element.get_text(strip=True)}\n"
-        elif element.name == 'p':
-            content += element.get_text(separator=' ', strip=True) + " "
-    
-    content = re.sub(r'[\n\r\t]', ' ', content)
-    content = re.sub(r'[^\x00-\x7F]+', '', content)
-    content = re.sub(r'\s+', ' ', content)
-    return title, content.strip()
-
-#Crawl the domain and scrape pages
-def crawl_domain(start_url):
-    visited = set()
-    pages_to_visit = [start_url]
+#Crawl the domain and scrape pages, fetching concurrently with a per-host rate limit.
+#With a CrawlState only new or changed pages are returned in all_data. With a CorpusWriter
+#the pages are appended to the corpus as they are scraped instead.
+def crawl_domain(start_url, concurrency=8, per_host=4, delay=0.25, state=None, profile='course_codes', writer=None):
     all_data = []
-    
-    while pages_to_visit:
-        current_url = pages_to_visit.pop(0)
 
-        if current_url in visited:
-            continue
+    def handle_page(current_url, page_html):
+        title, content, links = extract_csd_page(page_html, current_url)
+        if content:
+            cleaned_content = clean_and_normalize_text(content, profile)
+            if state is None or state.is_changed(current_url, title, cleaned_content):
+                if state:
+                    state.record(current_url, title=title, content=cleaned_content)
+                page = {'title': title, 'content': cleaned_content, 'url': current_url}
+                if writer:
+                    writer.add(page)
+                else:
+                    all_data.append(page)
+        return links
 
-        if can_scrape(current_url):
-            print(f"Visiting: {current_url}")
-            page_html = get_page_content(current_url)
-            if page_html:
-                title, content = extract_content(page_html)
-                if content:
-                    cleaned_content = clean_and_normalize_text(content)
-                    all_data.append({'title': title, 'content': cleaned_content})
-                
-                links = extract_links(page_html, current_url)
-                pages_to_visit.extend(links)
-            
-            visited.add(current_url)
-        
-        time.sleep(1)
-    
+    visited = crawl([start_url], handle_page, concurrency=concurrency, per_host=per_host, delay=delay, state=state)
     return visited, all_data
 
-#Extract links from a page
-def extract_links(page_html, base_url):
-    soup = BeautifulSoup(page_html, 'html.parser')
-    links = set()
-
-    for link_tag in soup.find_all('a', href=True):
-        href = link_tag.get('href')
-        if href.startswith('#'):
-            continue
-        full_url = urljoin(base_url, href)
-        if base_url in full_url:
-            links.add(full_url)
-    
-    return links
-
-#Save data to a JSON file
-def save_data_to_json(data, filename='scraped_info.json'):
-    if os.path.exists(filename):
-        with open(filename, 'r', encoding='utf-8') as f:
-            existing_data = json.load(f)
-    else:
-        existing_data = []
-    
-    existing_data.extend(data)
-
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, ensure_ascii=False, indent=4)
+#Append data to the JSONL corpus; a page saved before is superseded by its new line
+def save_data_to_json(data, filename=CORPUS_FILE):
+    if not data:
+        #Leave the corpus (and the index built from it) untouched
+        print(f"No new or changed pages; {filename} is unchanged.")
+        return
+    append_documents(filename, data)
     print(f"All data has been saved to {filename}.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--full', action='store_true', help='Refetch every page instead of only new or changed ones')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='course_codes',
+                        help="Text cleaning profile; 'letters' drops digits, and with them course codes")
+    parser.add_argument('--keep-duplicates', action='store_true', help='Store near-duplicate pages and site template text as they are')
+    args = parser.parse_args()
+
     start_url = "https://csd.uwo.ca"
-    visited_urls, all_data = crawl_domain(start_url)
-    save_data_to_json(all_data)
+    state = None if args.full else CrawlState(CORPUS_FILE)
+    #Pages are appended while the crawl runs, so a running QA engine picks them up;
+    #the crawl state of the saved pages is committed with every append
+    ingest = None if args.keep_duplicates else corpus_filter()
+    with CorpusWriter(on_flush=state.commit if state else None, ingest=ingest) as writer:
+        visited_urls, _ = crawl_domain(start_url, state=state, writer=writer, profile=args.profile)
+    print(f"{writer.written} new or changed pages have been saved to {CORPUS_FILE}.")
+    if ingest:
+        print(f"Ingest: {ingest.summary()}")
+    if state:
+        state.commit()
+        print(f"Pages: {state.summary()}")
+        state.close()
@@ -0,0 +1,249 @@
+import os
+import json
+import mmap
+import struct
+import time
+import hashlib
+
+#Append-only corpus: one JSON document per line in scraped_info.jsonl, and a sidecar
+#scraped_info.jsonl.idx2 with a fixed-size (offset, length, key, title key, has URL) record per
+#line, so any document is read with one seek and nothing is ever rewritten.
+#A page saved again (same URL) is appended as a new line; the newest line of a key wins but the
+#document keeps the position where its key first appeared. Pages saved before URLs were recorded
+#are keyed by title and content, so a page scraped again with its URL would never match its old
+#line; instead it replaces the first URL-less document with the same title, as store_pages()
+#replaces those rows in the database. A write is committed by appending
+#its sidecar records once its lines are on disk: lines without records (a writer that died
+#halfway) are ignored by readers and cut off by the next writer.
+
+CORPUS_FILE = 'scraped_info.jsonl'
+RECORD = struct.Struct('<QIQQ?')
+
+#The .idx sidecar of older versions had no title keys; the sidecar is rebuilt under a new name
+def index_path(path):
+    return f"{path}.idx2"
+
+#64-bit key of a document: its URL, or its title and content for pages saved without one
+def document_key(doc):
+    text = doc.get('url') or f"{doc.get('title')}\0{doc.get('content')}"
+    return int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+
+def title_key(title):
+    text = ' '.join((title or '').lower().split())
+    return int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+
+def document_record(offset, length, doc):
+    return RECORD.pack(offset, length, document_key(doc), title_key(doc.get('title')), bool(doc.get('url')))
+
+def encode_document(doc):
+    return json.dumps(doc, ensure_ascii=False).encode('utf-8') + b'\n'
+
+#Build the sidecar by scanning the corpus file; only complete lines are indexed
+def build_sidecar(path):
+    records = []
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            if line.strip():
+                records.append(document_record(offset, len(line) - 1, json.loads(line)))
+            offset += len(line)
+    tmp_path = f"{index_path(path)}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path(path))
+
+#Sidecar records from record start on, up to stop (all of them by default)
+def read_sidecar(path, start=0, stop=None):
+    if not os.path.exists(index_path(path)):
+        build_sidecar(path)
+    with open(index_path(path), 'rb') as f:
+        f.seek(start * RECORD.size)
+        data = f.read() if stop is None else f.read((stop - start) * RECORD.size)
+    #A record cut short by a crash isn't committed
+    data = data[:len(data) - len(data) % RECORD.size]
+    return [RECORD.unpack_from(data, i) for i in range(0, len(data), RECORD.size)]
+
+#Number of committed lines
+def committed_lines(path):
+    if not os.path.exists(index_path(path)):
+        build_sidecar(path)
+    return os.path.getsize(index_path(path)) // RECORD.size
+
+#Digest of the first lines sidecar records, to tell whether a corpus still starts with them
+def sidecar_digest(path, lines):
+    with open(index_path(path), 'rb') as f:
+        return hashlib.sha1(f.read(lines * RECORD.size)).hexdigest()
+
+#Append documents to the corpus: lines first, then their sidecar records
+def append_documents(path, docs):
+    if not os.path.exists(path):
+        open(path, 'wb').close()
+    #Only the last record is read, so an append costs the same however large the corpus is
+    count = committed_lines(path)
+    last = read_sidecar(path, count - 1) if count else []
+    committed = last[0][0] + last[0][1] + 1 if last else 0
+
+    new_records = []
+    with open(path, 'r+b') as f:
+        #Drop lines left by a writer that didn't finish
+        f.truncate(committed)
+        f.seek(committed)
+        offset = committed
+        for doc in docs:
+            line = encode_document(doc)
+            f.write(line)
+            new_records.append(document_record(offset, len(line) - 1, doc))
+            offset += len(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+    with open(index_path(path), 'ab') as f:
+        f.truncate(count * RECORD.size)
+        f.write(b''.join(new_records))
+        f.flush()
+        os.fsync(f.fileno())
+    return len(new_records)
+
+
+class CorpusWriter:
+    #Buffers scraped documents and appends them batch_size at a time, or once the oldest has
+    #waited flush_every seconds, so a running QA engine sees pages while the crawl goes on.
+    #on_flush is called after every append, e.g. to commit the crawl state of the saved pages.
+    #ingest is an optional dedup.IngestFilter every document goes through first.
+    def __init__(self, path=CORPUS_FILE, batch_size=50, flush_every=5.0, on_flush=None, ingest=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.on_flush = on_flush
+        self.ingest = ingest
+        self.docs = []
+        self.first_added = None
+        self.written = 0
+
+    def add(self, doc):
+        if self.ingest:
+            doc = self.ingest.filter(doc)
+            if doc is None:
+                return
+        if not self.docs:
+            self.first_added = time.monotonic()
+        self.docs.append(doc)
+        if len(self.docs) >= self.batch_size or time.monotonic() - self.first_added >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.docs:
+            append_documents(self.path, self.docs)
+            self.written += len(self.docs)
+            self.docs = []
+            if self.on_flush:
+                self.on_flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+#Rewrite the corpus with only the newest line of every document, replacing both files atomically
+def compact(path):
+    corpus = JSONLCorpus(path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for doc in corpus:
+            f.write(encode_document(doc))
+        f.flush()
+        os.fsync(f.fileno())
+    corpus.close()
+    os.replace(tmp_path, path)
+    build_sidecar(path)
+
+
+class JSONLCorpus:
+    #Read-only view of the corpus as a sequence of documents. Only the sidecar is read up front;
+    #documents are decoded from a memory map when they are accessed. lines limits the view to
+    #the corpus as it was after that many lines; update() picks up the rest.
+    def __init__(self, path=CORPUS_FILE, lines=None):
+        self.path = path
+        self.records = []
+        self.positions = {}
+        #(key, position) of the documents saved without a URL, by title key
+        self.without_url = {}
+        self.lines = 0
+        self.file = open(path, 'rb')
+        self.map = b''
+        self._add_records(read_sidecar(path, 0, lines))
+
+    def _add_records(self, records):
+        changed = []
+        for offset, length, key, title, has_url in records:
+            position = self.positions.get(key)
+            if position is None and has_url and self.without_url.get(title):
+                #The page was saved before without its URL; this line replaces that document
+                old_key, position = self.without_url[title].pop(0)
+                del self.positions[old_key]
+                self.positions[key] = position
+            if position is None:
+                position = self.positions[key] = len(self.records)
+                self.records.append((offset, length))
+                if not has_url:
+                    self.without_url.setdefault(title, []).append((key, position))
+            else:
+                self.records[position] = (offset, length)
+            changed.append(position)
+        self.lines += len(records)
+        if records:
+            #A reader still slicing the old map keeps it alive until it is done
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return sorted(set(changed))
+
+    #Read the lines committed since the corpus was opened or last updated. Returns the positions
+    #of the documents they added or superseded, new documents at the end, or None if the corpus
+    #was rewritten (compacted) and has to be opened again. stop limits the update to that many lines.
+    def update(self, stop=None):
+        if committed_lines(self.path) < self.lines or os.fstat(self.file.fileno()).st_ino != os.stat(self.path).st_ino:
+            return None
+        return self._add_records(read_sidecar(self.path, self.lines, stop))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        offset, length = self.records[i]
+        return json.loads(self.map[offset:offset + length])
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Manage the append-only JSONL corpus")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help="append the documents of a scraped_info.json file")
+    convert_parser.add_argument('json_file')
+    convert_parser.add_argument('--corpus', default=CORPUS_FILE)
+    compact_parser = subparsers.add_parser('compact', help="drop superseded lines")
+    compact_parser.add_argument('--corpus', default=CORPUS_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        with open(args.json_file, 'r', encoding='utf-8') as f:
+            docs = [doc for doc in json.load(f) if 'content' in doc]
+        append_documents(args.corpus, docs)
+        print(f"Appended {len(docs)} documents to {args.corpus}; {len(JSONLCorpus(args.corpus))} documents in total.")
+    else:
+        before = JSONLCorpus(args.corpus).lines
+        compact(args.corpus)
+        print(f"Compacted {args.corpus} from {before} to {JSONLCorpus(args.corpus).lines} lines.")
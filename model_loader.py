@@ -0,0 +1,84 @@
+import os
+import re
+import shutil
+import threading
+from transformers import AutoTokenizer, pipeline
+from quantization import load_quantized, MODEL_CACHE_DIR, QUANTIZATIONS
+
+#Models are loaded when they are first needed rather than when an engine is created, so a run
+#answering from the answer cache, or one that only builds the index, never loads one.
+#The first load saves the model as safetensors (and its fast tokenizer) in model_cache/; later
+#loads read that local copy, whose weights are memory-mapped instead of unpickled.
+
+#transformers patches module-level state while it loads a model, so two threads loading at once
+#can leave each other's weights uninitialized; loads take turns, other work still overlaps them
+LOAD_LOCK = threading.RLock()
+
+def local_path(model_name, cache_dir=MODEL_CACHE_DIR):
+    return os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', model_name))
+
+#Save the model and its fast tokenizer to path, through a temporary directory that is renamed,
+#so a copy that exists is complete
+def save_local_copy(model_class, model_name, path):
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = model_class.from_pretrained(model_name)
+    print(f"Saving {model_name} to {path}")
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    model.save_pretrained(tmp_path, safe_serialization=True)
+    tokenizer.save_pretrained(tmp_path)
+    os.replace(tmp_path, path)
+
+#Fast tokenizer and model_class model, from the local safetensors copy, made on the first load.
+#With quantize='int8' the model is dynamically quantized (see quantization.py); its config and,
+#the first time, its full-precision weights are read from the local copy too.
+def load_cached(model_class, model_name, cache_dir=MODEL_CACHE_DIR, quantize='none'):
+    with LOAD_LOCK:
+        path = local_path(model_name, cache_dir)
+        if not os.path.isdir(path):
+            save_local_copy(model_class, model_name, path)
+        tokenizer = AutoTokenizer.from_pretrained(path)
+        if quantize == 'int8':
+            return tokenizer, load_quantized(model_class, model_name, cache_dir, source=path)
+        return tokenizer, model_class.from_pretrained(path)
+
+#Fast tokenizer and model, dynamically quantized with quantize='int8'
+def load_model(model_class, model_name, quantize='none'):
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantize!r}")
+    return load_cached(model_class, model_name, quantize=quantize)
+
+
+class LazyPipeline:
+    #A transformers pipeline built on first use. The pipeline and the code preparing its inputs
+    #share its one fast tokenizer. preload() builds it in a background thread instead; a caller
+    #needing it before then waits for that thread.
+    def __init__(self, task, model_class, model_name, quantize='none'):
+        self.task = task
+        self.model_class = model_class
+        self.model_name = model_name
+        self.quantize = quantize
+        self.lock = threading.Lock()
+        self.pipeline = None
+        self.thread = None
+
+    def get(self):
+        if self.pipeline is None:
+            with self.lock:
+                if self.pipeline is None:
+                    tokenizer, model = load_model(self.model_class, self.model_name, self.quantize)
+                    self.pipeline = pipeline(self.task, model=model, tokenizer=tokenizer)
+        return self.pipeline
+
+    #A failed background load is retried, and raises, when the pipeline is next needed
+    def preload(self):
+        if self.pipeline is None and self.thread is None:
+            self.thread = threading.Thread(target=self._preload, daemon=True)
+            self.thread.start()
+        return self.thread
+
+    def _preload(self):
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Error occurred while preloading {self.model_name}: {e}")
@@ -0,0 +1,149 @@
+import numpy as np
+from corpus import load_documents, CORPUS_FILE
+
+#Scraped pages split into overlapping passages, the unit that is indexed, ranked and read.
+#Calendar entries are a few dozen words, but some csd.uwo.ca pages run to several hundred, and a
+#context of three whole pages overflows the readers' 512-token window. Passages are at most
+#PASSAGE_WORDS whitespace tokens (the tokens BM25 counts), which is about 130 model tokens, so the
+#top three fit in the window with the question. Consecutive passages of a page overlap by about
+#OVERLAP_WORDS words so an answer on a boundary is whole in one of them. Pages that fit in one
+#passage are kept as they are.
+
+PASSAGE_WORDS = 100
+OVERLAP_WORDS = 25
+
+def _ends_sentence(word):
+    return word[-1] in '.!?'
+
+#(start, end) word ranges of the passages of a page. A passage ends at the last sentence end in
+#its second half if there is one, and the next one starts at a sentence start in the overlap.
+def passage_spans(words, max_words=PASSAGE_WORDS, overlap=OVERLAP_WORDS):
+    if len(words) <= max_words:
+        return [(0, len(words))]
+    spans = []
+    start = 0
+    while True:
+        end = min(start + max_words, len(words))
+        if end < len(words):
+            for i in range(end, start + max_words // 2, -1):
+                if _ends_sentence(words[i - 1]):
+                    end = i
+                    break
+        spans.append((start, end))
+        if end == len(words):
+            return spans
+        next_start = max(end - overlap, start + 1)
+        for i in range(next_start, end):
+            if _ends_sentence(words[i - 1]):
+                next_start = i
+                break
+        start = next_start
+
+
+class Passages:
+    #Read-only sequence of the passages of a document sequence (a JSONLCorpus or a list), each a
+    #dict with the page's title and url, the passage content, and doc_id and passage, the position
+    #of its page and its number within the page. Passage ids are stable: a page updated by
+    #update() keeps its passage ids and takes new ones at the end if it grew. The ids it no longer
+    #needs are removed, and read as None.
+    #spans, as spans_array() returns them for the same documents, are taken instead of splitting
+    #the pages again, so only the pages they don't cover are read; the others are read when accessed.
+    def __init__(self, documents, max_words=PASSAGE_WORDS, overlap=OVERLAP_WORDS, spans=None):
+        self.documents = documents
+        self.max_words = max_words
+        self.overlap = overlap
+        #(doc_id, passage, start, end) of every passage; start is None for a whole page
+        self.spans = []
+        self.doc_passages = []
+        if spans is not None:
+            for passage_id, (doc_id, number, start, end) in enumerate(np.asarray(spans).tolist()):
+                if number < 0:
+                    self.spans.append((doc_id, None, 0, 0))
+                elif start < 0:
+                    self.spans.append((doc_id, number, None, None))
+                else:
+                    self.spans.append((doc_id, number, start, end))
+                while len(self.doc_passages) <= doc_id:
+                    self.doc_passages.append([])
+                self.doc_passages[doc_id].append(passage_id)
+        for doc_id in range(len(self.doc_passages), len(documents)):
+            self._split(doc_id, documents[doc_id])
+
+    #Passage parameters, saved with the indexes built from the passages
+    @property
+    def params(self):
+        return [self.max_words, self.overlap]
+
+    #The spans as an (n, 4) int64 array, None stored as -1, saved with the indexes
+    def spans_array(self):
+        rows = [[-1 if value is None else value for value in span] for span in self.spans]
+        return np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+    #Corpus lines the passages were read from, for a JSONLCorpus
+    @property
+    def lines(self):
+        return getattr(self.documents, 'lines', None)
+
+    def _split(self, doc_id, doc):
+        words = doc['content'].split()
+        spans = passage_spans(words, self.max_words, self.overlap)
+        if len(spans) == 1:
+            spans = [(None, None)]
+        if doc_id == len(self.doc_passages):
+            self.doc_passages.append([])
+        passage_ids = self.doc_passages[doc_id]
+        for number, (start, end) in enumerate(spans):
+            if number < len(passage_ids):
+                self.spans[passage_ids[number]] = (doc_id, number, start, end)
+            else:
+                passage_ids.append(len(self.spans))
+                self.spans.append((doc_id, number, start, end))
+        for passage_id in passage_ids[len(spans):]:
+            self.spans[passage_id] = (doc_id, None, 0, 0)
+        return passage_ids
+
+    #Read the documents changed since the passages were split (see JSONLCorpus.update()) and
+    #split them again. Returns the ids of the passages added, changed or removed, or None if the
+    #corpus was rewritten and has to be opened again.
+    def update(self, stop=None):
+        changed = self.documents.update(stop)
+        if changed is None:
+            return None
+        passage_ids = set()
+        for doc_id in changed:
+            passage_ids.update(self._split(doc_id, self.documents[doc_id]))
+        return sorted(passage_ids)
+
+    def _passage(self, passage_id, doc):
+        doc_id, number, start, end = self.spans[passage_id]
+        if number is None:
+            return None
+        if start is None:
+            content = doc['content']
+        else:
+            content = ' '.join(doc['content'].split()[start:end])
+        return {'title': doc.get('title') or '', 'content': content, 'url': doc.get('url'),
+                'doc_id': doc_id, 'passage': number}
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        return self._passage(i, self.documents[self.spans[i][0]])
+
+    #Every page is read once, in passage order
+    def __iter__(self):
+        doc_id = doc = None
+        for i, span in enumerate(self.spans):
+            if span[0] != doc_id:
+                doc_id = span[0]
+                doc = self.documents[doc_id]
+            yield self._passage(i, doc)
+
+    def close(self):
+        if hasattr(self.documents, 'close'):
+            self.documents.close()
+
+#Passages of the documents in a source, as load_documents reads them
+def load_passages(source=CORPUS_FILE, max_words=PASSAGE_WORDS, overlap=OVERLAP_WORDS, spans=None):
+    return Passages(load_documents(source), max_words, overlap, spans)
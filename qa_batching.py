@@ -0,0 +1,38 @@
+#Helpers for answering many questions at once with the transformers pipelines.
+#Inputs are sorted by length before they reach the pipeline, so each padded batch
+#holds inputs of similar length, and the outputs are put back in the original order.
+
+#Indices of the inputs, shortest first
+def length_order(texts):
+    return sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+#Put outputs computed in the given order back in input order
+def restore_order(order, outputs):
+    results = [None] * len(order)
+    for i, output in zip(order, outputs):
+        results[i] = output
+    return results
+
+#Run an extractive question-answering pipeline over (question, context) pairs
+def run_extractive(qa_pipeline, questions, contexts, batch_size=8, **kwargs):
+    if not questions:
+        return []
+    order = length_order(contexts)
+    outputs = qa_pipeline(question=[questions[i] for i in order], context=[contexts[i] for i in order],
+                          batch_size=batch_size, **kwargs)
+    #The pipeline returns a bare dict when given a single pair
+    if isinstance(outputs, dict):
+        outputs = [outputs]
+    return restore_order(order, outputs)
+
+#Generate answers straight from prompt token ids, padding length-grouped batches
+def run_generate(model, tokenizer, inputs, batch_size=8):
+    if not inputs:
+        return []
+    order = length_order(inputs)
+    texts = []
+    for start in range(0, len(order), batch_size):
+        batch = tokenizer.pad({'input_ids': [inputs[i] for i in order[start:start + batch_size]]}, return_tensors='pt')
+        outputs = model.generate(input_ids=batch['input_ids'].to(model.device), attention_mask=batch['attention_mask'].to(model.device))
+        texts.extend(tokenizer.batch_decode(outputs, skip_special_tokens=True, clean_up_tokenization_spaces=False))
+    return restore_order(order, texts)
@@ -0,0 +1,447 @@
+import json
+from collections import OrderedDict
+from transformers import AutoModelForQuestionAnswering, AutoModelForSeq2SeqLM
+from corpus import CORPUS_FILE
+from passages import load_passages
+from retrieval_index import load_index, load_live_index, load_spans, is_stale
+from dense_index import SentenceEncoder, HybridIndex, load_dense_index, EMBEDDING_MODEL
+from reranker import Reranker, RERANK_MODEL, RERANK_CANDIDATES
+from quantization import QUANTIZATIONS
+from model_loader import LazyPipeline
+from course_index import CourseCodeIndex
+from scraped_store import FTSIndex
+from qa_batching import run_extractive, run_generate
+from retriever import Retriever
+from answer_cache import AnswerCache, cache_key
+
+#Question answering over the scraped documents with pluggable model backends.
+#A backend is picked by name from BACKENDS. An engine can hold several of them as tiers:
+#every question goes to the first (cheapest) tier, and only answers scoring below the
+#confidence threshold are sent on to the next one.
+
+#Max input token limit for T5
+MAX_TOKENS = 512
+
+#Answers containing site footer text are not real answers
+def reject_boilerplate(answer, question, context):
+    irrelevant_phrases = ["Privacy", "Web Standards", "Terms of Use", "Accessibility"]
+    for phrase in irrelevant_phrases:
+        if phrase in answer:
+            return "Sorry, I couldn't find an answer."
+    return answer
+
+#Allow short answers that are relevant to the question or context
+def require_relevance(answer, question, context):
+    if not answer:
+        return "I don't know"
+    if is_answer_relevant(question, answer, context):
+        return answer
+    return "I don't know"
+
+#Generated answers need at least a few words
+def require_min_words(answer, question, context):
+    if not answer or len(answer.split()) < 3:
+        return "I don't know"
+    return answer
+
+def keep_answer(answer, question, context):
+    return answer
+
+VALIDATORS = {
+    'boilerplate': reject_boilerplate,
+    'relevance': require_relevance,
+    'min_words': require_min_words,
+    'none': keep_answer,
+}
+
+#Check if the generated answer is relevant to the question and context
+def is_answer_relevant(question, answer, context):
+    question_terms = set(question.lower().split())
+    answer_terms = set(answer.lower().split())
+
+    #Check if the answer contains key terms from the question
+    if question_terms.intersection(answer_terms):
+        return True
+
+    context_terms = set(context.lower().split())
+    if answer_terms.intersection(context_terms):
+        return True
+
+    if len(answer.split()) <= 2 and any(term in answer.lower() for term in question_terms):
+        return True
+
+    #If the answer doesn't address the question, return False
+    return False
+
+
+class Backend:
+    #Retrieve top_n documents, answer, and re-run the answers that look too short
+    #(or irrelevant, with check_relevance) once with fallback_top_n documents.
+    #The model's pipeline (of the subclass's task) is loaded when it is first used.
+    #quantize='int8' runs the model dynamically quantized (see quantization.py).
+    task = None
+    model_class = None
+
+    def __init__(self, model, top_n=3, fallback_top_n=5, min_words=3, check_relevance=False, validate='none', quantize='none'):
+        self.model = model
+        self.quantize = quantize
+        self.loader = LazyPipeline(self.task, self.model_class, model, quantize)
+        self.top_n = top_n
+        self.fallback_top_n = fallback_top_n
+        self.min_words = min_words
+        self.check_relevance = check_relevance
+        self.validate = VALIDATORS[validate]
+
+    @property
+    def qa_pipeline(self):
+        return self.loader.get()
+
+    #Load the model in a background thread
+    def preload(self):
+        return self.loader.preload()
+
+    #Returns a list of {'answer', 'score'} dicts; score is None when the model gives no confidence.
+    #context_docs holds the ids of the documents each context was joined from.
+    def run(self, retriever, questions, contexts, context_docs, batch_size):
+        raise NotImplementedError()
+
+    def needs_more_context(self, question, answer, context):
+        if len(answer.split()) < self.min_words:
+            return True
+        return self.check_relevance and not is_answer_relevant(question, answer, context)
+
+    #Answer a batch of questions; doc_ids holds each question's filtered documents or None
+    def answer_batch(self, engine, questions, doc_ids, batch_size=8):
+        retriever = engine.retriever
+        #Rank once for the wider fallback context; the first pass uses the top of the same ranking
+        rankings = retriever.ranked(questions, doc_ids, max(self.top_n, self.fallback_top_n))
+        contexts = retriever.contexts(rankings, self.top_n)
+        results = self.run(retriever, questions, contexts, [ranked[:self.top_n] for ranked in rankings], batch_size)
+
+        #Re-run short or irrelevant answers together in a second batched pass with more context
+        retry = [i for i, result in enumerate(results) if self.needs_more_context(questions[i], result['answer'], contexts[i])]
+        if retry:
+            retry_questions = [questions[i] for i in retry]
+            retry_rankings = [rankings[i][:self.fallback_top_n] for i in retry]
+            retry_contexts = retriever.contexts(retry_rankings, self.fallback_top_n)
+            retry_results = self.run(retriever, retry_questions, retry_contexts, retry_rankings, batch_size)
+            for i, result, context in zip(retry, retry_results, retry_contexts):
+                results[i] = result
+                contexts[i] = context
+
+        return self.finish(questions, results, contexts)
+
+    #Validate the final answers against the contexts they came from
+    def finish(self, questions, results, contexts):
+        answers = []
+        for question, result, context in zip(questions, results, contexts):
+            answer = self.validate(result['answer'], question, context)
+            #A rejected answer counts as no confidence at all
+            score = result['score'] if answer == result['answer'] else 0.0
+            answers.append({'answer': answer, 'score': score})
+        return answers
+
+
+#SQuAD-style span extraction (BERT, DistilBERT, RoBERTa).
+#With windowed=True the retrieved documents are read one at a time in rank order instead of
+#as one joined context, stopping at the first span scoring at least window_threshold.
+class ExtractiveBackend(Backend):
+    task = "question-answering"
+    model_class = AutoModelForQuestionAnswering
+
+    def __init__(self, model, windowed=False, window_threshold=0.5, window_cache_size=4096, **options):
+        super().__init__(model, **options)
+        self.windowed = windowed
+        self.window_threshold = window_threshold
+        self.window_cache_size = window_cache_size
+        self.windows = OrderedDict()
+
+    def answer_batch(self, engine, questions, doc_ids, batch_size=8):
+        if not self.windowed:
+            return super().answer_batch(engine, questions, doc_ids, batch_size)
+
+        retriever = engine.retriever
+        depth = max(self.top_n, self.fallback_top_n)
+        rankings = retriever.ranked(questions, doc_ids, depth)
+        best = [{'answer': '', 'score': 0.0} for _ in questions]
+        read = [0] * len(questions)
+
+        #Read the rank-r document of every question still without a confident span
+        pending = list(range(len(questions)))
+        for rank in range(depth):
+            pending = [i for i in pending if rank < len(rankings[i])]
+            if not pending:
+                break
+            results = self.read_windows(engine, [questions[i] for i in pending], [rankings[i][rank] for i in pending], batch_size)
+            for i, result in zip(pending, results):
+                read[i] = rank + 1
+                if result['score'] > best[i]['score'] or not best[i]['answer']:
+                    best[i] = result
+            pending = [i for i in pending if best[i]['score'] < self.window_threshold]
+
+        contexts = [retriever.contexts([ranked], count)[0] for ranked, count in zip(rankings, read)]
+        return self.finish(questions, best, contexts)
+
+    #Answer each question from a single document, reusing windows already read for that pair
+    def read_windows(self, engine, questions, doc_ids, batch_size):
+        keys = [(engine.index.corpus_hash, question, doc_id) for question, doc_id in zip(questions, doc_ids)]
+        missing = [j for j, key in enumerate(keys) if key not in self.windows]
+        if missing:
+            contexts = [engine.documents[doc_ids[j]]['content'] for j in missing]
+            results = self.run(engine.retriever, [questions[j] for j in missing], contexts, [[doc_ids[j]] for j in missing], batch_size)
+            for j, result in zip(missing, results):
+                self.windows[keys[j]] = result
+                if len(self.windows) > self.window_cache_size:
+                    self.windows.popitem(last=False)
+
+        results = []
+        for key in keys:
+            if key in self.windows:
+                self.windows.move_to_end(key)
+            results.append(self.windows.get(key) or {'answer': '', 'score': 0.0})
+        return results
+
+    def run(self, retriever, questions, contexts, context_docs, batch_size):
+        results = run_extractive(self.qa_pipeline, questions, contexts, batch_size, max_answer_len=512)
+        return [{'answer': result['answer'], 'score': result['score']} for result in results]
+
+
+#T5 text2text generation; gives no confidence score, so it is best used as the last tier
+class GenerativeBackend(Backend):
+    task = "text2text-generation"
+    model_class = AutoModelForSeq2SeqLM
+
+    #The pipeline's fast tokenizer, also used to build the prompts
+    @property
+    def tokenizer(self):
+        return self.qa_pipeline.tokenizer
+
+    #Token ids of "question: ... context: ..." within MAX_TOKENS, the context packed from the
+    #cached encodings of the ranked documents, so nothing is decoded and encoded again
+    def prompt_ids(self, retriever, question, doc_ids):
+        prefix = self.tokenizer.encode(f"question: {question} context:", add_special_tokens=False)
+        budget = MAX_TOKENS - len(prefix) - 1
+        return prefix + retriever.packed_context_ids(self.tokenizer, doc_ids, budget) + [self.tokenizer.eos_token_id]
+
+    def run(self, retriever, questions, contexts, context_docs, batch_size):
+        inputs = [self.prompt_ids(retriever, question, doc_ids) for question, doc_ids in zip(questions, context_docs)]
+        answers = run_generate(self.qa_pipeline.model, self.tokenizer, inputs, batch_size)
+        return [{'answer': answer, 'score': None} for answer in answers]
+
+
+BACKEND_TYPES = {
+    'extractive': ExtractiveBackend,
+    'generative': GenerativeBackend,
+}
+
+#The settings the four model scripts used, by backend name
+BACKENDS = {
+    'bert': {'type': 'extractive', 'model': 'bert-large-uncased-whole-word-masking-finetuned-squad',
+             'top_n': 3, 'fallback_top_n': 5, 'min_words': 15, 'validate': 'boilerplate'},
+    'distilbert': {'type': 'extractive', 'model': 'distilbert-base-uncased-distilled-squad',
+                   'top_n': 3, 'fallback_top_n': 5, 'min_words': 3, 'check_relevance': True, 'validate': 'relevance'},
+    'roberta': {'type': 'extractive', 'model': 'deepset/roberta-large-squad2',
+                'top_n': 5, 'fallback_top_n': 7, 'min_words': 3, 'check_relevance': True, 'validate': 'none'},
+    't5': {'type': 'generative', 'model': 't5-large',
+           'top_n': 3, 'fallback_top_n': 5, 'min_words': 15, 'validate': 'min_words'},
+}
+
+#Add a backend to the registry, e.g. register_backend('minilm', type='extractive', model='...')
+def register_backend(name, **config):
+    BACKENDS[name] = config
+
+#Registered settings of a backend with any per-engine overrides applied
+def backend_config(name, options=None):
+    return dict(BACKENDS[name], **(options or {}))
+
+def create_backend(name, options=None):
+    config = backend_config(name, options)
+    backend_type = BACKEND_TYPES[config.pop('type')]
+    return backend_type(config.pop('model'), **config)
+
+
+class QAEngine:
+    #Loads the documents, BM25 index and course index once and shares them between the backends.
+    #Long pages are split into passages (see passages.py), and documents, the index and the
+    #contexts the backends read are all made of passages.
+    #cache is an optional AnswerCache checked before any model runs.
+    #backend_options overrides registered settings per backend, e.g. {'distilbert': {'windowed': True}}.
+    #retrieval='fts' ranks whole pages with the FTS5 index of a scraped_data.db source instead of BM25.
+    #retrieval='hybrid' fuses BM25 with dense retrieval over embedding_model sentence embeddings.
+    #rerank_model names a cross-encoder that reorders the top rerank_candidates passages before the
+    #backends read the best of them.
+    #With a .jsonl source the BM25 index is live: pages the scrapers append are added to it on refresh().
+    def __init__(self, backends=('distilbert',), threshold=0.0, source=CORPUS_FILE, cache=None, backend_options=None, retrieval='bm25',
+                 embedding_model=EMBEDDING_MODEL, rerank_model=None, rerank_candidates=RERANK_CANDIDATES):
+        if retrieval not in ('bm25', 'fts', 'hybrid'):
+            raise ValueError(f"Unknown retrieval {retrieval!r}")
+        if retrieval == 'fts' and not source.endswith('.db'):
+            raise ValueError("FTS retrieval needs a .db source")
+        self.source = source
+        self.retrieval = retrieval
+        self.live = retrieval != 'fts' and source.endswith('.jsonl')
+        self.encoder = SentenceEncoder(embedding_model) if retrieval == 'hybrid' else None
+        self.reranker = Reranker(rerank_model) if rerank_model else None
+        self.rerank_candidates = rerank_candidates
+        self.backend_names = list(backends)
+        backend_options = backend_options or {}
+        self.backend_configs = [backend_config(name, backend_options.get(name)) for name in self.backend_names]
+        self.backends = [create_backend(name, backend_options.get(name)) for name in self.backend_names]
+        self.load_corpus()
+        self.threshold = threshold
+        self.routed = {name: 0 for name in self.backend_names}
+        self.cache = cache
+        #Identifies the models and settings behind an answer, for the cache key
+        retrieval_id = [retrieval, embedding_model] if retrieval == 'hybrid' else retrieval
+        if rerank_model:
+            retrieval_id = [retrieval_id, rerank_model, rerank_candidates]
+        self.model_id = json.dumps([[name, config] for name, config in zip(self.backend_names, self.backend_configs)] + [threshold, retrieval_id], sort_keys=True)
+
+    def load_corpus(self):
+        if self.retrieval == 'fts':
+            self.index = FTSIndex(self.source)
+            self.documents = self.index.documents
+        elif self.live:
+            self.documents, self.index = load_live_index(self.source)
+        else:
+            self.index = load_index(self.source)
+            self.documents = load_passages(self.source, spans=load_spans())
+        if self.encoder:
+            dense = load_dense_index(self.documents, self.encoder, self.source, lines=self.index.meta.get('lines'),
+                                     spans=load_spans())
+            self.index = HybridIndex(self.index, dense)
+        self.course_index = CourseCodeIndex(self.documents)
+        depth = max(max(backend.top_n, backend.fallback_top_n) for backend in self.backends)
+        self.retriever = Retriever(self.index, self.documents, depth, reranker=self.reranker, candidates=self.rerank_candidates)
+
+    #Bring the documents and index up to date with what the scrapers have written since they were
+    #loaded: lines appended to a JSONL corpus are added to the live index, other sources are reloaded
+    def refresh(self):
+        if self.live:
+            changed = self.documents.update()
+            if changed is None:
+                self.load_corpus()
+            elif changed:
+                docs = [self.documents[i] for i in changed]
+                self.index.add_documents(changed, docs)
+                for doc_id, doc in zip(changed, docs):
+                    self.course_index.update(doc_id, doc)
+                self.retriever.forget(changed)
+            else:
+                return
+        elif self.index.is_stale() if self.retrieval == 'fts' else is_stale(self.source):
+            self.load_corpus()
+        else:
+            return
+        if self.cache:
+            self.cache.purge(self.index.corpus_hash)
+
+    #Engine from a dict or JSON file: {"backends": [...], "threshold": 0.3, "source": ..., "retrieval": "bm25", "embedding_model": ...,
+    #"rerank_model": "cross-encoder/ms-marco-MiniLM-L-6-v2", "rerank_candidates": 50,
+    #"cache_size": 1024, "cache_db": "answer_cache.db", "register": {name: config}, "backend_options": {name: options}}
+    @classmethod
+    def from_config(cls, config):
+        if isinstance(config, str):
+            with open(config, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        for name, backend_config in config.get('register', {}).items():
+            register_backend(name, **backend_config)
+        cache = None
+        if config.get('cache_size') or config.get('cache_db'):
+            cache = AnswerCache(config.get('cache_size', 1024), config.get('cache_db'))
+        return cls(config.get('backends', ['distilbert']), config.get('threshold', 0.0),
+                   config.get('source', CORPUS_FILE), cache, config.get('backend_options'),
+                   config.get('retrieval', 'bm25'), config.get('embedding_model', EMBEDDING_MODEL),
+                   config.get('rerank_model'), config.get('rerank_candidates', RERANK_CANDIDATES))
+
+    #Start loading every backend's model in a background thread. Questions asked meanwhile wait
+    #only for the models they need; later tiers keep loading while the first one answers.
+    def preload(self):
+        return [backend.preload() for backend in self.backends]
+
+    #Answer a batch of questions, escalating low-confidence answers to the next backend.
+    #Returns {'answer', 'score', 'backend'} for every question; repeat questions come from the cache.
+    def answer_details(self, questions, batch_size=8):
+        self.refresh()
+        if not self.cache:
+            return self._answer_details(questions, batch_size)
+
+        corpus_version = self.index.corpus_hash
+        keys = [cache_key(question, self.model_id, corpus_version) for question in questions]
+        details = [self.cache.get(key) for key in keys]
+
+        #Questions that normalize to the same key are answered once
+        misses = {}
+        for i, detail in enumerate(details):
+            if detail is None:
+                misses.setdefault(keys[i], i)
+        if misses:
+            answered = dict(zip(misses, self._answer_details([questions[i] for i in misses.values()], batch_size)))
+            for key, detail in answered.items():
+                self.cache.put(key, detail, corpus_version)
+            details = [detail or answered[key] for key, detail in zip(keys, details)]
+        return details
+
+    def _answer_details(self, questions, batch_size):
+        doc_ids = [self.course_index.lookup_question(question) for question in questions]
+        details = [None] * len(questions)
+        pending = list(range(len(questions)))
+
+        for tier, (name, backend) in enumerate(zip(self.backend_names, self.backends)):
+            last_tier = tier == len(self.backends) - 1
+            results = backend.answer_batch(self, [questions[i] for i in pending], [doc_ids[i] for i in pending], batch_size)
+            escalate = []
+            for i, result in zip(pending, results):
+                details[i] = dict(result, backend=name)
+                if not last_tier and result['score'] is not None and result['score'] < self.threshold:
+                    escalate.append(i)
+                else:
+                    self.routed[name] += 1
+            pending = escalate
+            if not pending:
+                break
+        return details
+
+    def answer_questions(self, questions, batch_size=8):
+        return [detail['answer'] for detail in self.answer_details(questions, batch_size)]
+
+    def answer_question(self, question):
+        return self.answer_questions([question], batch_size=1)[0]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Answer questions with one or more tiered model backends")
+    parser.add_argument('questions', nargs='+')
+    parser.add_argument('--backends', default='distilbert', help="comma separated, cheapest first: " + ", ".join(BACKENDS))
+    parser.add_argument('--threshold', type=float, default=0.0, help="escalate answers scoring below this")
+    parser.add_argument('--cache-db', help="SQLite file for answers kept between runs, e.g. answer_cache.db")
+    parser.add_argument('--windowed', type=float, metavar='THRESHOLD',
+                        help="read extractive contexts one document at a time, stopping at a span scoring THRESHOLD")
+    parser.add_argument('--quantize', choices=QUANTIZATIONS, default='none', help="int8 runs the models dynamically quantized on the CPU")
+    parser.add_argument('--source', default=CORPUS_FILE, help="scraped_info.jsonl, scraped_info.json or scraped_data.db")
+    parser.add_argument('--retrieval', choices=['bm25', 'fts', 'hybrid'], default='bm25',
+                        help="fts searches a .db source with its FTS5 index, hybrid adds dense retrieval to BM25")
+    parser.add_argument('--embedding-model', default=EMBEDDING_MODEL, help="sentence embedding model for hybrid retrieval")
+    parser.add_argument('--rerank', nargs='?', const=RERANK_MODEL, metavar='MODEL',
+                        help=f"rerank retrieved passages with a cross-encoder (default {RERANK_MODEL})")
+    parser.add_argument('--rerank-candidates', type=int, default=RERANK_CANDIDATES, help="passages the cross-encoder scores per question")
+    parser.add_argument('--config', help="JSON engine config, overrides the other options")
+    args = parser.parse_args()
+
+    if args.config:
+        engine = QAEngine.from_config(args.config)
+    else:
+        cache = AnswerCache(db_path=args.cache_db) if args.cache_db else None
+        backends = args.backends.split(',')
+        backend_options = {name: {'quantize': args.quantize} for name in backends}
+        if args.windowed is not None:
+            for name in backends:
+                if BACKENDS[name]['type'] == 'extractive':
+                    backend_options[name].update(windowed=True, window_threshold=args.windowed)
+        engine = QAEngine(backends, args.threshold, args.source, cache, backend_options, args.retrieval, args.embedding_model,
+                          args.rerank, args.rerank_candidates)
+    engine.preload()
+    for question, detail in zip(args.questions, engine.answer_details(args.questions)):
+        print(f"{question} : {detail['answer']} [{detail['backend']}, score={detail['score']}]")
+    print("Answered by:", engine.routed)
@@ -0,0 +1,204 @@
+import json
+import math
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from corpus import CORPUS_FILE
+from qa_engine import QAEngine, BACKENDS
+from dense_index import EMBEDDING_MODEL
+from reranker import RERANK_MODEL, RERANK_CANDIDATES
+from quantization import QUANTIZATIONS
+from answer_cache import AnswerCache
+
+#Keeps a QAEngine (models, tokenizers and BM25 index) loaded and answers questions over
+#HTTP on localhost. Concurrent questions are microbatched into one answer_questions call,
+#so they share the models' forward passes.
+#
+#  python qa_service.py --backends distilbert,roberta --threshold 0.3 --port 8000
+#  curl -s localhost:8000/answer -d '{"question": "What is Computer Science 1025 about?"}'
+#  curl -s localhost:8000/stats
+
+#Percentile of a list of numbers (nearest rank)
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class MicroBatcher:
+    #Collects questions from many threads and answers them in batches.
+    #A batch is sent once max_batch questions are waiting or the oldest has waited max_wait seconds.
+    def __init__(self, answer_batch, max_batch=16, max_wait=0.01, history=10000):
+        self.answer_batch = answer_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.latencies = deque(maxlen=history)
+        self.batch_sizes = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    #Queue a question and return a Future for its answer
+    def submit(self, question):
+        future = Future()
+        self.requests.put((question, future, time.perf_counter()))
+        return future
+
+    def answer(self, question, timeout=None):
+        return self.submit(question).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._answer(batch)
+
+    def _answer(self, batch):
+        try:
+            answers = self.answer_batch([question for question, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.perf_counter()
+        with self.lock:
+            self.batch_sizes.append(len(batch))
+            for (_, future, started), answer in zip(batch, answers):
+                self.latencies.append(done - started)
+                future.set_result(answer)
+
+    #Request count, p50/p99 latency in milliseconds and the average batch size
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            batch_sizes = list(self.batch_sizes)
+        to_ms = lambda value: None if value is None else round(value * 1000, 2)
+        return {
+            'requests': len(latencies),
+            'batches': len(batch_sizes),
+            'avg_batch_size': round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else None,
+            'p50_ms': to_ms(percentile(latencies, 50)),
+            'p99_ms': to_ms(percentile(latencies, 99)),
+            'queued': self.requests.qsize(),
+        }
+
+
+#HTTP handler: POST /answer {"question": ...}, GET /stats, GET /health
+class QAHandler(BaseHTTPRequestHandler):
+    engine = None
+    batcher = None
+    timeout_seconds = 120
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            stats = dict(self.batcher.stats(), routed=self.engine.routed)
+            if self.engine.cache:
+                stats['cache'] = self.engine.cache.stats()
+            self._send_json(200, stats)
+        elif self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/answer':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            question = json.loads(self.rfile.read(length) or b'{}').get('question')
+        except (ValueError, AttributeError):
+            question = None
+        if not isinstance(question, str) or not question.strip():
+            self._send_json(400, {'error': 'expected a JSON body with a "question" string'})
+            return
+
+        started = time.perf_counter()
+        try:
+            answer = self.batcher.answer(question, self.timeout_seconds)
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, {'question': question, 'answer': answer,
+                              'latency_ms': round((time.perf_counter() - started) * 1000, 2)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+#HTTP server answering with the engine through a MicroBatcher; port 0 picks a free port
+def create_server(engine, host='127.0.0.1', port=8000, max_batch=16, max_wait=0.01):
+    answer_batch = lambda questions: engine.answer_questions(questions, batch_size=max_batch)
+    QAHandler.engine = engine
+    QAHandler.batcher = MicroBatcher(answer_batch, max_batch, max_wait)
+    return ThreadingHTTPServer((host, port), QAHandler)
+
+#Start the service; the models, tokenizers and index are loaded once here
+def serve(engine, host='127.0.0.1', port=8000, max_batch=16, max_wait=0.01):
+    server = create_server(engine, host, port, max_batch, max_wait)
+    print(f"Serving {', '.join(engine.backend_names)} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(QAHandler.batcher.stats()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the QA engine over HTTP with the models kept loaded")
+    parser.add_argument('--backends', default='distilbert', help="comma separated, cheapest first: " + ", ".join(BACKENDS))
+    parser.add_argument('--threshold', type=float, default=0.0, help="escalate answers scoring below this")
+    parser.add_argument('--cache-size', type=int, default=1024, help="answers kept in memory, 0 to disable the cache")
+    parser.add_argument('--cache-db', help="SQLite file for answers kept between runs, e.g. answer_cache.db")
+    parser.add_argument('--quantize', choices=QUANTIZATIONS, default='none', help="int8 runs the models dynamically quantized on the CPU")
+    parser.add_argument('--source', default=CORPUS_FILE, help="scraped_info.jsonl, scraped_info.json or scraped_data.db")
+    parser.add_argument('--retrieval', choices=['bm25', 'fts', 'hybrid'], default='bm25',
+                        help="fts searches a .db source with its FTS5 index, hybrid adds dense retrieval to BM25")
+    parser.add_argument('--embedding-model', default=EMBEDDING_MODEL, help="sentence embedding model for hybrid retrieval")
+    parser.add_argument('--rerank', nargs='?', const=RERANK_MODEL, metavar='MODEL',
+                        help=f"rerank retrieved passages with a cross-encoder (default {RERANK_MODEL})")
+    parser.add_argument('--rerank-candidates', type=int, default=RERANK_CANDIDATES, help="passages the cross-encoder scores per question")
+    parser.add_argument('--config', help="JSON engine config, overrides the backend, corpus and cache options")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    args = parser.parse_args()
+
+    if args.config:
+        engine = QAEngine.from_config(args.config)
+    else:
+        cache = AnswerCache(args.cache_size, args.cache_db) if args.cache_size else None
+        backends = args.backends.split(',')
+        backend_options = {name: {'quantize': args.quantize} for name in backends}
+        engine = QAEngine(backends, args.threshold, args.source, cache, backend_options, retrieval=args.retrieval,
+                          embedding_model=args.embedding_model, rerank_model=args.rerank, rerank_candidates=args.rerank_candidates)
+    #The models load while the server starts; the first requests wait for them
+    engine.preload()
+    serve(engine, args.host, args.port, args.max_batch, args.max_wait_ms / 1000)
@@ -0,0 +1,84 @@
+import os
+import re
+import time
+import torch
+from transformers import AutoConfig, GenerationConfig
+
+#Dynamic int8 quantization of the reader models for CPU inference. The weights of every Linear
+#layer are stored as int8 (a quarter of their size) and the activations are quantized on the
+#fly; a BERT-base reader runs about twice as fast on the CPU and takes less than half the
+#memory, and the large models, being mostly Linear weights, gain more. A quantized model is
+#saved in model_cache/ the first time it is converted. Later runs build the quantized layers
+#from the model config and load the saved int8 weights, without reading the full-precision ones.
+
+MODEL_CACHE_DIR = 'model_cache'
+QUANTIZATIONS = ('none', 'int8')
+
+def quantized_path(model_name, cache_dir=MODEL_CACHE_DIR):
+    return os.path.join(cache_dir, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)}-int8.pt")
+
+def quantize_model(model):
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+#model_class (e.g. AutoModelForQuestionAnswering) loaded as a dynamically quantized int8 model.
+#The packed int8 weights depend on the torch version, so a cache from another version is redone.
+#source is where the config and full-precision weights are read from (model_name by default).
+def load_quantized(model_class, model_name, cache_dir=MODEL_CACHE_DIR, source=None):
+    source = source or model_name
+    path = quantized_path(model_name, cache_dir)
+    saved = torch.load(path, weights_only=False) if os.path.exists(path) else None
+    if saved is not None and saved['torch'] == torch.__version__:
+        model = quantize_model(model_class.from_config(AutoConfig.from_pretrained(source)))
+        model.load_state_dict(saved['state_dict'])
+        if model.can_generate():
+            #from_config only has the generation defaults of the model config
+            try:
+                model.generation_config = GenerationConfig.from_pretrained(source)
+            except OSError:
+                pass
+    else:
+        print(f"Quantizing {model_name} to int8 in {path}")
+        model = quantize_model(model_class.from_pretrained(source))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        torch.save({'torch': torch.__version__, 'state_dict': model.state_dict()}, tmp_path)
+        os.replace(tmp_path, path)
+    model.eval()
+    return model
+
+
+#Answer the questions at full precision and quantized, and compare. create_engine(quantize)
+#builds an engine for either; it should have no answer cache, so every answer comes from the
+#model. Returns a summary dict and the (question, full-precision answer, quantized answer) rows.
+def parity_check(create_engine, questions, quantize='int8', batch_size=8):
+    results = {}
+    for mode in ('none', quantize):
+        start = time.perf_counter()
+        engine = create_engine(mode)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        details = engine.answer_details(questions, batch_size)
+        results[mode] = (load_seconds, time.perf_counter() - start, details)
+        del engine
+
+    reference, quantized = results['none'][2], results[quantize][2]
+    same = sum(1 for a, b in zip(reference, quantized) if a['answer'].strip().lower() == b['answer'].strip().lower())
+    score_deltas = [abs(a['score'] - b['score']) for a, b in zip(reference, quantized)
+                    if a['score'] is not None and b['score'] is not None]
+    summary = {
+        'questions': len(questions),
+        'same_answers': same,
+        'max_score_delta': max(score_deltas) if score_deltas else None,
+        'load_seconds': {mode: round(result[0], 2) for mode, result in results.items()},
+        'answer_seconds': {mode: round(result[1], 2) for mode, result in results.items()},
+    }
+    rows = [(question, a['answer'], b['answer']) for question, a, b in zip(questions, reference, quantized)]
+    return summary, rows
+
+#Print a parity_check() report, the differing answers first
+def print_parity(summary, rows):
+    for question, reference, quantized in sorted(rows, key=lambda row: row[1].strip().lower() == row[2].strip().lower()):
+        marker = '=' if reference.strip().lower() == quantized.strip().lower() else '!'
+        print(f"{marker} {question}\n    full: {reference}\n    int8: {quantized}")
+    print(f"{summary['same_answers']}/{summary['questions']} answers unchanged, max score change {summary['max_score_delta']}")
+    print(f"Load: {summary['load_seconds']}  Answering: {summary['answer_seconds']}")
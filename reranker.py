@@ -0,0 +1,56 @@
+import torch
+from transformers import AutoModelForSequenceClassification
+from model_loader import load_cached
+from dense_index import document_text
+from qa_batching import length_order, restore_order
+
+#Optional second retrieval stage. The index ranks RERANK_CANDIDATES passages for a question, a
+#small cross-encoder reads each (question, passage) pair and scores how well the passage answers
+#it, and only the best few go on to the reader. The cross-encoder is a fraction of the size of the
+#large readers, so scoring 50 short passages costs less than one fallback re-run it saves.
+
+RERANK_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+RERANK_CANDIDATES = 50
+
+
+class Reranker:
+    #Scores question-passage pairs in length-sorted, padded batches
+    def __init__(self, model=RERANK_MODEL, max_tokens=256, batch_size=32):
+        self.model_name = model
+        self.tokenizer, self.model = load_cached(AutoModelForSequenceClassification, model)
+        self.model.eval()
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size
+
+    #Relevance score of every (question, text) pair; the last logit is the relevant class for
+    #two-label models, and the only one for regression heads
+    def score(self, questions, texts):
+        if not questions:
+            return []
+        order = length_order(texts)
+        scores = []
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            inputs = self.tokenizer([questions[i] for i in batch], [texts[i] for i in batch], padding=True,
+                                    truncation='only_second', max_length=self.max_tokens, return_tensors='pt')
+            with torch.inference_mode():
+                logits = self.model(**inputs).logits
+            scores.extend(logits[:, -1].tolist())
+        return restore_order(order, scores)
+
+    #The top_n passage ids of each ranking, reordered by the cross-encoder. All the pairs of the
+    #batch of questions are scored together; ties keep the order of the first-stage ranking.
+    def rerank(self, questions, rankings, documents, top_n):
+        questions_flat = []
+        texts = []
+        for question, ranked in zip(questions, rankings):
+            for doc_id in ranked:
+                questions_flat.append(question)
+                texts.append(document_text(documents[doc_id]))
+        scores = iter(self.score(questions_flat, texts))
+        results = []
+        for ranked in rankings:
+            ranked_scores = [next(scores) for _ in ranked]
+            order = sorted(range(len(ranked)), key=lambda i: -ranked_scores[i])
+            results.append([ranked[i] for i in order[:top_n]])
+        return results
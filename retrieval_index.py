@@ -0,0 +1,497 @@
+import os
+import json
+import math
+import hashlib
+import numpy as np
+from scipy import sparse
+from corpus import source_fingerprint, CORPUS_FILE
+from jsonl_corpus import JSONLCorpus, committed_lines, sidecar_digest
+from passages import Passages, load_passages, PASSAGE_WORDS, OVERLAP_WORDS
+
+INDEX_DIR = 'bm25_index'
+INDEX_VERSION = 4
+
+#Same parameters as rank_bm25.BM25Okapi so rankings do not change
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+
+#Whitespace tokenization, same as the old doc.split() / question.split()
+def tokenize(text):
+    return text.split()
+
+#BM25Okapi idf with the epsilon floor for terms found in more than half of the documents
+def compute_idf(doc_freqs, corpus_size):
+    idf = [math.log(corpus_size - freq + 0.5) - math.log(freq + 0.5) for freq in doc_freqs]
+    idf_sum = 0
+    for value in idf:
+        idf_sum += value
+    average_idf = idf_sum / len(idf) if idf else 0
+    eps = EPSILON * average_idf
+    return np.array([eps if value < 0 else value for value in idf], dtype=np.float64)
+
+#BM25Okapi term weight for the given idf, term frequency and document length
+def bm25_weights(idf, tf, doc_len, avgdl):
+    tf = tf.astype(np.float64)
+    return idf * (tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc_len / avgdl)))
+
+#Index files are written to a temporary file and renamed into place. Processes that already have
+#the old file memory-mapped keep reading it (the old inode lives on until they close it), where
+#rewriting the file in place would truncate it under their mapping and kill them with SIGBUS.
+def save_array(path, array):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def save_json(path, value):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+#Build the inverted index and save it to index_dir
+def build_index(documents, index_dir=INDEX_DIR, source=None):
+    vocab = {}
+    doc_len = []
+    doc_offsets = [0]
+    doc_terms = []
+    doc_tfs = []
+    corpus_hash = hashlib.sha1()
+
+    for doc in documents:
+        content = doc['content'] if isinstance(doc, dict) else doc
+        corpus_hash.update(content.encode('utf-8'))
+        corpus_hash.update(b'\0')
+        tokens = tokenize(content)
+        doc_len.append(len(tokens))
+
+        #Term frequencies, keeping the order in which terms first appear
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, freq in frequencies.items():
+            doc_terms.append(vocab.setdefault(token, len(vocab)))
+            doc_tfs.append(freq)
+        doc_offsets.append(len(doc_terms))
+
+    corpus_size = len(doc_len)
+    doc_terms = np.array(doc_terms, dtype=np.int32)
+    doc_tfs = np.array(doc_tfs, dtype=np.int32)
+    doc_ids = np.repeat(np.arange(corpus_size, dtype=np.int32), np.diff(doc_offsets))
+
+    #Postings: for every term, the documents containing it (sorted by document id) and the term counts
+    order = np.argsort(doc_terms, kind='stable')
+    postings = doc_ids[order]
+    tfs = doc_tfs[order]
+    doc_freqs = np.bincount(doc_terms, minlength=len(vocab))
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(doc_freqs, out=offsets[1:])
+    idf = compute_idf(doc_freqs.tolist(), corpus_size)
+    avgdl = sum(doc_len) / corpus_size if corpus_size else 0
+
+    #Precomputed BM25 weight of every posting, the data of the CSR term-document matrix
+    term_ids = np.repeat(np.arange(len(vocab)), doc_freqs)
+    weights = bm25_weights(idf[term_ids], tfs, np.array(doc_len, dtype=np.int32)[postings], avgdl)
+
+    os.makedirs(index_dir, exist_ok=True)
+    save_array(os.path.join(index_dir, 'offsets.npy'), offsets)
+    save_array(os.path.join(index_dir, 'postings.npy'), postings)
+    save_array(os.path.join(index_dir, 'tfs.npy'), tfs)
+    save_array(os.path.join(index_dir, 'weights.npy'), weights)
+    save_array(os.path.join(index_dir, 'idf.npy'), idf)
+    save_array(os.path.join(index_dir, 'doc_len.npy'), np.array(doc_len, dtype=np.int32))
+    save_array(os.path.join(index_dir, 'doc_offsets.npy'), np.array(doc_offsets, dtype=np.int64))
+    save_array(os.path.join(index_dir, 'doc_terms.npy'), doc_terms)
+    save_json(os.path.join(index_dir, 'vocab.json'), vocab)
+
+    #meta.json is written last so a half-written index is never loaded
+    meta = {
+        'version': INDEX_VERSION,
+        'corpus_size': corpus_size,
+        'avgdl': avgdl,
+        'corpus_hash': corpus_hash.hexdigest(),
+        'fingerprint': source_fingerprint(source) if source else None,
+    }
+    spans_path = os.path.join(index_dir, 'spans.npy')
+    if isinstance(documents, Passages):
+        #The passage spans, so loading the passages again doesn't split every page (see load_spans)
+        save_array(spans_path, documents.spans_array())
+        meta['passages'] = documents.params
+        if source and isinstance(documents.documents, JSONLCorpus):
+            #The corpus lines indexed, so a live index can take the lines appended after them
+            meta['lines'] = documents.lines
+            meta['sidecar_digest'] = sidecar_digest(source, documents.lines)
+    elif os.path.exists(spans_path):
+        os.remove(spans_path)
+    save_json(os.path.join(index_dir, 'meta.json'), meta)
+    return meta
+
+#Spans of the passages the saved index was built from, for Passages(), or None if it was not
+#built from passages
+def load_spans(index_dir=INDEX_DIR):
+    spans_path = os.path.join(index_dir, 'spans.npy')
+    return np.load(spans_path, mmap_mode='r') if os.path.exists(spans_path) else None
+
+#Check whether the saved index is missing or older than its source
+def is_stale(source, index_dir=INDEX_DIR):
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return (meta.get('version') != INDEX_VERSION or meta.get('passages') != [PASSAGE_WORDS, OVERLAP_WORDS]
+            or meta.get('fingerprint') != source_fingerprint(source))
+
+#Load the shared index of the source's passages, rebuilding it first if the source has changed
+def load_index(source=CORPUS_FILE, index_dir=INDEX_DIR):
+    if is_stale(source, index_dir):
+        print(f"Building BM25 index for {source} in {index_dir}")
+        build_index(load_passages(source), index_dir, source)
+    return BM25Index(index_dir)
+
+#Open the passages of a JSONL corpus and a LiveIndex over them. The saved index is reused when
+#the corpus still starts with the lines it was built from, and the lines appended since are added
+#in memory; it is rebuilt if it is missing or the corpus was rewritten, or when more lines were appended
+#since than it holds.
+def load_live_index(source=CORPUS_FILE, index_dir=INDEX_DIR):
+    meta_path = os.path.join(index_dir, 'meta.json')
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    lines = meta.get('lines')
+    total = committed_lines(source)
+    if (meta.get('version') != INDEX_VERSION or meta.get('passages') != [PASSAGE_WORDS, OVERLAP_WORDS]
+            or lines is None or lines > total or total - lines > lines
+            or sidecar_digest(source, lines) != meta.get('sidecar_digest')):
+        print(f"Building BM25 index for {source} in {index_dir}")
+        documents = Passages(JSONLCorpus(source))
+        build_index(documents, index_dir, source)
+        return documents, LiveIndex(index_dir)
+
+    documents = Passages(JSONLCorpus(source, lines), spans=load_spans(index_dir))
+    index = LiveIndex(index_dir)
+    changed = documents.update()
+    if changed:
+        index.add_documents(changed, [documents[i] for i in changed])
+    return documents, index
+
+
+class BM25Index:
+    #Memory-maps a saved index; only the postings of the query terms are touched per query
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, 'vocab.json'), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+        self.corpus_size = self.meta['corpus_size']
+        self.avgdl = self.meta['avgdl']
+        self.corpus_hash = self.meta['corpus_hash']
+        self.offsets = self._load('offsets.npy')
+        self.postings = self._load('postings.npy')
+        self.tfs = self._load('tfs.npy')
+        self.weights = self._load('weights.npy')
+        self.idf = self._load('idf.npy')
+        self.doc_len = self._load('doc_len.npy')
+        self.doc_offsets = self._load('doc_offsets.npy')
+        self.doc_terms = self._load('doc_terms.npy')
+        self._matrix = None
+
+    #CSR term-document matrix of BM25 weights, built over the memory-mapped postings
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = sparse.csr_matrix((self.weights, self.postings, self.offsets),
+                                             shape=(len(self.vocab), self.corpus_size), copy=False)
+        return self._matrix
+
+    def _load(self, name):
+        return np.load(os.path.join(self.index_dir, name), mmap_mode='r')
+
+    def _doc_terms(self, doc_id):
+        return self.doc_terms[self.doc_offsets[doc_id]:self.doc_offsets[doc_id + 1]]
+
+    def _term_postings(self, term_id):
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.postings[start:end], self.tfs[start:end], self.weights[start:end]
+
+    #Statistics of a sub-corpus, as if BM25Okapi had been built on those documents only
+    def _subset_stats(self, doc_ids):
+        doc_freqs = {}
+        for doc_id in doc_ids:
+            for term_id in self._doc_terms(doc_id):
+                term_id = int(term_id)
+                doc_freqs[term_id] = doc_freqs.get(term_id, 0) + 1
+        idf = compute_idf(list(doc_freqs.values()), len(doc_ids))
+        idf = dict(zip(doc_freqs.keys(), idf.tolist()))
+        doc_len = self.doc_len[doc_ids]
+        avgdl = int(doc_len.sum()) / len(doc_ids)
+        return idf, avgdl
+
+    #BM25 scores of the documents that contain at least one query term
+    def score_candidates(self, query_tokens, doc_ids=None):
+        if doc_ids is None:
+            idf, avgdl = None, self.avgdl
+        else:
+            idf, avgdl = self._subset_stats(doc_ids)
+
+        candidate_ids = []
+        contributions = []
+        for token in query_tokens:
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            docs, tf, weights = self._term_postings(term_id)
+            if idf is None:
+                candidate_ids.append(docs)
+                contributions.append(weights)
+                continue
+
+            #Filtered documents need weights from their own statistics
+            term_idf = idf.get(term_id, 0)
+            if not term_idf:
+                continue
+            keep = np.isin(docs, doc_ids)
+            docs, tf = docs[keep], tf[keep]
+            candidate_ids.append(docs)
+            contributions.append(bm25_weights(term_idf, tf, self.doc_len[docs], avgdl))
+
+        if not candidate_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        #bincount adds the contributions in query order, the same order BM25Okapi.get_scores uses
+        candidate_ids, inverse = np.unique(np.concatenate(candidate_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(candidate_ids))
+        return candidate_ids, scores
+
+    #Ids of the top_n documents with a positive score, best first, for fusing with other rankings
+    def matching(self, query_tokens, top_n=3, doc_ids=None):
+        if doc_ids is not None:
+            doc_ids = np.unique(np.asarray(doc_ids, dtype=np.int64))
+            if len(doc_ids) == 0:
+                return []
+        candidate_ids, scores = self.score_candidates(query_tokens, doc_ids)
+        positive = scores > 0
+        return top_k(np.asarray(candidate_ids, dtype=np.int64)[positive], scores[positive], top_n)
+
+    #Return the ids of the top_n documents for the query, best first
+    def search(self, query_tokens, top_n=3, doc_ids=None):
+        if doc_ids is not None:
+            doc_ids = np.unique(np.asarray(doc_ids, dtype=np.int64))
+            if len(doc_ids) == 0:
+                return []
+        candidate_ids, scores = self.score_candidates(query_tokens, doc_ids)
+        return rank_candidates(candidate_ids, scores, top_n, self.corpus_size, doc_ids)
+
+    #Rank many queries, each over the whole corpus (None) or over its own filtered documents.
+    #Unfiltered queries are ranked together by search_batch. queries, the question texts, are
+    #only read by indexes that embed them (HybridIndex).
+    def search_many(self, queries_tokens, top_n=3, doc_ids=None, queries=None):
+        if doc_ids is None:
+            return self.search_batch(queries_tokens, top_n)
+        results = [None] * len(queries_tokens)
+        unfiltered = [i for i, ids in enumerate(doc_ids) if ids is None]
+        for i, top_ids in zip(unfiltered, self.search_batch([queries_tokens[i] for i in unfiltered], top_n)):
+            results[i] = top_ids
+        for i, ids in enumerate(doc_ids):
+            if ids is not None:
+                results[i] = self.search(queries_tokens[i], top_n, ids)
+        return results
+
+    #Rank a whole batch of queries over the full corpus with one sparse matrix product
+    def search_batch(self, queries_tokens, top_n=3):
+        if not queries_tokens:
+            return []
+        #One row per query, one entry per query token in query order. Repeated tokens are
+        #kept as separate entries so every document sums its terms in the same order as search()
+        indptr = [0]
+        indices = []
+        for query_tokens in queries_tokens:
+            indices.extend(term_id for term_id in map(self.vocab.get, query_tokens) if term_id is not None)
+            indptr.append(len(indices))
+        queries = sparse.csr_matrix((np.ones(len(indices)), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                                    shape=(len(queries_tokens), len(self.vocab)))
+
+        scores = queries @ self.matrix
+        results = []
+        for row in range(len(queries_tokens)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            results.append(rank_candidates(scores.indices[start:end], scores.data[start:end], top_n, self.corpus_size))
+        return results
+
+
+class LiveIndex(BM25Index):
+    #A saved index that takes new and changed documents as they are scraped, without a rebuild.
+    #Added documents are kept in memory; document frequencies, lengths and avgdl are updated as
+    #they come in. Until then the saved weights are used as they are; after that, term weights
+    #are computed from the current statistics at query time, ranking as a rebuilt index would.
+    def __init__(self, index_dir=INDEX_DIR):
+        super().__init__(index_dir)
+        self.base_size = self.corpus_size
+        self.base_terms = len(self.vocab)
+        self.doc_len = np.array(self.doc_len, dtype=np.int64)
+        self.doc_freqs = np.diff(self.offsets)
+        self.total_len = int(self.doc_len.sum())
+        #Saved documents whose postings are outdated, and the postings of the added documents
+        self.replaced = set()
+        self.replaced_ids = np.zeros(0, dtype=np.int64)
+        self.added_postings = {}
+        self.added_terms = {}
+        #Documents removed since, which no longer count towards the statistics
+        self.removed = set()
+        self.changed = False
+
+    def _doc_terms(self, doc_id):
+        if doc_id in self.added_terms:
+            return self.added_terms[doc_id]
+        return super()._doc_terms(doc_id)
+
+    def _remove(self, doc_id):
+        if doc_id in self.added_terms:
+            for term_id in self.added_terms.pop(doc_id):
+                del self.added_postings[term_id][doc_id]
+                self.doc_freqs[term_id] -= 1
+        elif doc_id not in self.replaced:
+            self.replaced.add(doc_id)
+            self.doc_freqs[super()._doc_terms(doc_id)] -= 1
+        self.total_len -= int(self.doc_len[doc_id])
+
+    #Add documents (dicts or plain text, as for build_index), replace the content of existing
+    #ones, or remove them (None), as Passages.update() returns them. New documents must take the
+    #next ids in order.
+    def add_documents(self, doc_ids, docs):
+        corpus_hash = hashlib.sha1(self.corpus_hash.encode('utf-8'))
+        for doc_id, doc in zip(doc_ids, docs):
+            if doc is None:
+                corpus_hash.update(f"{doc_id}\1".encode('utf-8'))
+                tokens = []
+                self.removed.add(doc_id)
+            else:
+                content = doc['content'] if isinstance(doc, dict) else doc
+                corpus_hash.update(f"{doc_id}\0{content}\0".encode('utf-8'))
+                tokens = tokenize(content)
+                self.removed.discard(doc_id)
+            if doc_id < self.corpus_size:
+                self._remove(doc_id)
+            elif doc_id == self.corpus_size:
+                self.corpus_size += 1
+                if self.corpus_size > len(self.doc_len):
+                    self.doc_len = np.resize(self.doc_len, max(self.corpus_size, 2 * len(self.doc_len)))
+            else:
+                raise ValueError(f"Document {doc_id} added after {self.corpus_size} documents")
+            self.doc_len[doc_id] = len(tokens)
+            self.total_len += len(tokens)
+
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            term_ids = []
+            for token, freq in frequencies.items():
+                term_id = self.vocab.setdefault(token, len(self.vocab))
+                if term_id >= len(self.doc_freqs):
+                    self.doc_freqs = np.resize(self.doc_freqs, max(len(self.vocab), 2 * len(self.doc_freqs)))
+                    self.doc_freqs[term_id:] = 0
+                self.doc_freqs[term_id] += 1
+                self.added_postings.setdefault(term_id, {})[doc_id] = freq
+                term_ids.append(term_id)
+            self.added_terms[doc_id] = term_ids
+
+        self.replaced_ids = np.array(sorted(self.replaced), dtype=np.int64)
+        size = self.corpus_size - len(self.removed)
+        self.avgdl = self.total_len / size if size else 0
+        #Terms no document contains any more don't count towards the average idf, as after a rebuild
+        doc_freqs = self.doc_freqs[:len(self.vocab)]
+        present = doc_freqs > 0
+        self.idf = np.zeros(len(self.vocab), dtype=np.float64)
+        self.idf[present] = compute_idf(doc_freqs[present].tolist(), size)
+        self.corpus_hash = corpus_hash.hexdigest()
+        self.changed = True
+
+    def _term_postings(self, term_id):
+        if not self.changed:
+            return super()._term_postings(term_id)
+        docs = np.zeros(0, dtype=np.int64)
+        tfs = np.zeros(0, dtype=np.int32)
+        if term_id < self.base_terms:
+            docs, tfs, _ = super()._term_postings(term_id)
+            if len(self.replaced_ids):
+                keep = ~np.isin(docs, self.replaced_ids)
+                docs, tfs = docs[keep], tfs[keep]
+        added = self.added_postings.get(term_id)
+        if added:
+            docs = np.concatenate([docs, np.fromiter(added.keys(), dtype=np.int64, count=len(added))])
+            tfs = np.concatenate([tfs, np.fromiter(added.values(), dtype=np.int32, count=len(added))])
+        return docs, tfs, bm25_weights(self.idf[term_id], tfs, self.doc_len[docs], self.avgdl)
+
+    #Removed documents have no terms, so they could only turn up among the zero-scoring
+    #documents that fill a short ranking; they are left out of those
+    def search(self, query_tokens, top_n=3, doc_ids=None):
+        if not self.removed:
+            return super().search(query_tokens, top_n, doc_ids)
+        ranked = super().search(query_tokens, top_n + len(self.removed), doc_ids)
+        return [doc_id for doc_id in ranked if doc_id not in self.removed][:top_n]
+
+    def search_batch(self, queries_tokens, top_n=3):
+        if not self.changed:
+            return super().search_batch(queries_tokens, top_n)
+        #The saved weight matrix is out of date
+        return [self.search(query_tokens, top_n) for query_tokens in queries_tokens]
+
+
+#Order documents the way scores.argsort()[-top_n:][::-1] did over the whole corpus.
+#Documents outside the candidates score 0, and ties go to the later document.
+def rank_candidates(candidate_ids, scores, top_n, corpus_size, doc_ids=None):
+    candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+    positive = scores > 0
+    negative = scores < 0
+    ranked = []
+
+    ranked.extend(top_k(candidate_ids[positive], scores[positive], top_n))
+
+    if len(ranked) < top_n:
+        #Walk the zero-scoring documents from the highest id down, stopping once top_n is filled
+        scored = set(candidate_ids[~(scores == 0)].tolist())
+        universe = range(corpus_size - 1, -1, -1) if doc_ids is None else reversed(doc_ids.tolist())
+        for doc_id in universe:
+            if len(ranked) >= top_n:
+                break
+            if doc_id not in scored:
+                ranked.append(doc_id)
+
+    if len(ranked) < top_n:
+        ranked.extend(top_k(candidate_ids[negative], scores[negative], top_n - len(ranked)))
+
+    return ranked
+
+#Best k ids by score, ties going to the higher id, without sorting every candidate
+def top_k(ids, scores, k):
+    if k <= 0 or len(ids) == 0:
+        return []
+    if len(ids) > k:
+        #argpartition finds the k-th best score, then only the ids at or above it are sorted
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        keep = scores >= kth_score
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((-ids, -scores))
+    return ids[order][:k].tolist()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the BM25 index or rank a file of questions against it")
+    parser.add_argument('--source', default=CORPUS_FILE)
+    parser.add_argument('--questions', help="text file with one question per line to rank in a single batch")
+    parser.add_argument('--top-n', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.questions:
+        index = load_index(args.source)
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+        for question, top_ids in zip(questions, index.search_batch([tokenize(q) for q in questions], args.top_n)):
+            print(question, ": ", top_ids)
+    else:
+        meta = build_index(load_passages(args.source), INDEX_DIR, args.source)
+        print(f"Indexed {meta['corpus_size']} passages from {args.source} into {INDEX_DIR}")
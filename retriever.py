@@ -0,0 +1,111 @@
+import re
+from collections import OrderedDict
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+class Retriever:
+    #Ranks each question's documents once, deep enough for the widest fallback context, and keeps
+    #the ranking, so a top_n=3 context and its top_n=5 fallback are both slices of one list.
+    #Per-document token encodings (split by sentence) are cached too, so contexts can be put
+    #together from them without tokenizing the joined text again.
+    #With a Reranker the index ranks candidates documents and the reranker picks the depth best.
+    def __init__(self, index, documents, depth=7, capacity=4096, reranker=None, candidates=50):
+        self.index = index
+        self.documents = documents
+        self.depth = depth
+        self.capacity = capacity
+        self.reranker = reranker
+        self.candidates = candidates
+        self.rankings = OrderedDict()
+        self.encodings = {}
+
+    #Ranked document ids for each question, at least top_n deep.
+    #doc_ids holds each question's filtered documents, or None to search the whole corpus.
+    def ranked(self, questions, doc_ids=None, top_n=None):
+        if doc_ids is None:
+            doc_ids = [None] * len(questions)
+        if top_n and top_n > self.depth:
+            #A deeper ranking was asked for; the shallower cached ones can't be sliced from
+            self.depth = top_n
+            self.rankings.clear()
+
+        keys = [(tuple(question.split()), None if ids is None else tuple(ids)) for question, ids in zip(questions, doc_ids)]
+        texts = dict(zip(keys, questions))
+        missing = list(OrderedDict.fromkeys(key for key in keys if key not in self.rankings))
+        if missing:
+            results = self.search(missing, [texts[key] for key in missing])
+            for key, ranked in zip(missing, results):
+                self.rankings[key] = ranked
+                if len(self.rankings) > self.capacity:
+                    self.rankings.popitem(last=False)
+
+        rankings = []
+        for key, question in zip(keys, questions):
+            ranked = self.rankings.get(key)
+            if ranked is None:
+                #Evicted by a batch larger than the cache
+                ranked = self.search([key], [question])[0]
+            else:
+                self.rankings.move_to_end(key)
+            rankings.append(ranked)
+        return rankings
+
+    #Rank the (question tokens, filtered documents) keys, through the reranker if there is one.
+    #The dense index and the reranker read the question texts rather than the tokens.
+    def search(self, keys, questions):
+        queries_tokens = [list(tokens) for tokens, _ in keys]
+        doc_ids = [ids for _, ids in keys]
+        if self.reranker is None:
+            return self.index.search_many(queries_tokens, self.depth, doc_ids, questions)
+        candidates = self.index.search_many(queries_tokens, max(self.candidates, self.depth), doc_ids, questions)
+        return self.reranker.rerank(questions, candidates, self.documents, self.depth)
+
+    #Drop the rankings, which may now miss documents, and the encodings of changed documents
+    def forget(self, doc_ids):
+        doc_ids = set(doc_ids)
+        self.rankings.clear()
+        self.encodings = {key: encodings for key, encodings in self.encodings.items() if key[1] not in doc_ids}
+
+    #Context text of the top_n documents of each ranking
+    def contexts(self, rankings, top_n):
+        return [" ".join([self.documents[i]['content'] for i in ranked[:top_n]]) for ranked in rankings]
+
+    #Token ids of each sentence of one document, encoded once per tokenizer
+    def sentence_encodings(self, tokenizer, doc_id):
+        key = (id(tokenizer), doc_id)
+        encodings = self.encodings.get(key)
+        if encodings is None:
+            sentences = SENTENCE_BOUNDARY.split(self.documents[doc_id]['content'].strip())
+            encodings = [tokenizer.encode(sentence, add_special_tokens=False) for sentence in sentences if sentence]
+            self.encodings[key] = encodings
+        return encodings
+
+    #Token count of one document, from its cached encodings
+    def token_count(self, tokenizer, doc_id):
+        return sum(len(ids) for ids in self.sentence_encodings(tokenizer, doc_id))
+
+    #Context token ids packed greedily from the ranked documents into a budget of max_tokens.
+    #Documents are taken whole while they fit; one that doesn't fit contributes its leading
+    #sentences that do, and lower-ranked documents can still fill the space that is left.
+    def packed_context_ids(self, tokenizer, doc_ids, max_tokens):
+        ids = []
+        for doc_id in doc_ids:
+            remaining = max_tokens - len(ids)
+            if remaining <= 0:
+                break
+            if self.token_count(tokenizer, doc_id) <= remaining:
+                for sentence in self.sentence_encodings(tokenizer, doc_id):
+                    ids.extend(sentence)
+                continue
+            for sentence in self.sentence_encodings(tokenizer, doc_id):
+                if len(sentence) > max_tokens - len(ids):
+                    break
+                ids.extend(sentence)
+
+        #A top document made of one very long sentence is cut rather than left out
+        if not ids and doc_ids:
+            for sentence in self.sentence_encodings(tokenizer, doc_ids[0]):
+                ids.extend(sentence[:max_tokens - len(ids)])
+                if len(ids) >= max_tokens:
+                    break
+        return ids
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import requests
+import urllib.robotparser
+from urllib.parse import urlparse
+
+#robots.txt policies cached per host and shared by all the scrapers. Fetched files are kept in
+#robots_cache.json, so later runs only fetch robots.txt again once it is older than the TTL.
+
+ROBOTS_CACHE_FILE = 'robots_cache.json'
+ROBOTS_TTL = 24 * 60 * 60
+
+def host_of(url):
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+#Build a parser from a fetched robots.txt the way RobotFileParser.read() treats the response:
+#401/403 disallow everything, other errors allow everything
+def parse_robots(robots_url, status, text):
+    rp = urllib.robotparser.RobotFileParser(robots_url)
+    if status in (401, 403):
+        rp.disallow_all = True
+    elif status == 200:
+        rp.parse(text.splitlines())
+    else:
+        rp.allow_all = True
+    return rp
+
+
+class RobotsCache:
+    def __init__(self, path=ROBOTS_CACHE_FILE, ttl=ROBOTS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.parsers = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    #Cached policy for the host, or None if it has not been fetched or is older than the TTL
+    def policy(self, host):
+        entry = self.entries.get(host)
+        if entry is None or time.time() - entry['fetched'] > self.ttl:
+            return None
+        if host not in self.parsers:
+            self.parsers[host] = parse_robots(f"{host}/robots.txt", entry['status'], entry['text'])
+        return self.parsers[host]
+
+    #Remember a fetched robots.txt; status 0 (network error) is only kept for this run
+    def store(self, host, status, text=''):
+        self.entries[host] = {'fetched': time.time(), 'status': status, 'text': text}
+        self.parsers.pop(host, None)
+        if status:
+            self.save()
+        return self.policy(host)
+
+    def save(self):
+        if not self.path:
+            return
+        entries = {host: entry for host, entry in self.entries.items() if entry['status']}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    #Fetch robots.txt for the host unless a fresh copy is cached
+    def fetch(self, host):
+        rp = self.policy(host)
+        if rp is not None:
+            return rp
+        robots_url = f"{host}/robots.txt"
+        try:
+            response = requests.get(robots_url, timeout=30)
+            return self.store(host, response.status_code, response.text)
+        except Exception as e:
+            print(f"Error occurred while fetching {robots_url}: {e}")
+            return self.store(host, 0)
+
+    def can_fetch(self, url, user_agent='*'):
+        return self.fetch(host_of(url)).can_fetch(user_agent, url)
+
+    def crawl_delay(self, url, user_agent='*'):
+        return self.fetch(host_of(url)).crawl_delay(user_agent)
+
+
+_shared_cache = None
+
+#The cache shared by every scraper in this process
+def shared_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RobotsCache()
+    return _shared_cache
+
+#Check if the URL can be scraped (robots.txt)
+def can_scrape(url):
+    return shared_cache().can_fetch(url)
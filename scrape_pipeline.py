@@ -0,0 +1,136 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+#Pipelined scraping.
+#Fetcher threads download pages and push the raw HTML into a bounded queue. A pool of parser
+#processes takes it from there, so parsing runs on every core while the fetchers keep waiting
+#on the network. Parsed pages come back to the thread iterating over run(), the single writer
+#that stores them. A full HTML queue makes the fetchers wait, so memory stays bounded when
+#parsing falls behind.
+
+class RateLimiter:
+    #Spaces the requests of all fetcher threads at least delay seconds apart
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.delay
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ScrapePipeline:
+    #fetch(url, task) runs in the fetcher threads and returns a tuple starting with the page HTML
+    #(anything else than a non-empty str skips parsing); parse(page_html, task) runs in the parser
+    #processes, so it and task must be picklable.
+    def __init__(self, fetch, parse, fetchers=4, parsers=None, queue_size=32, delay=1.0, report_every=10.0):
+        self.fetch = fetch
+        self.parse = parse
+        self.fetchers = fetchers
+        self.parsers = parsers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.report_every = report_every
+        self.limiter = RateLimiter(delay)
+        self.fetch_queue = queue.Queue()
+        self.html_queue = queue.Queue(maxsize=queue_size)
+        self.results_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.parsing = 0
+        self.done = 0
+
+    #Queue a page to fetch; may be called while iterating over run()
+    def add(self, url, task=None):
+        self.pending += 1
+        self.fetch_queue.put((url, task))
+
+    def fetcher(self):
+        while True:
+            item = self.fetch_queue.get()
+            if item is None:
+                return
+            url, task = item
+            self.limiter.wait()
+            try:
+                fetched = self.fetch(url, task)
+            except Exception as e:
+                print(f"Error occurred while fetching {url}: {e}")
+                fetched = (None,)
+            self.html_queue.put((url, task, fetched))
+
+    def dispatcher(self, pool):
+        slots = threading.Semaphore(self.parsers * 2)
+        while True:
+            item = self.html_queue.get()
+            if item is None:
+                return
+            url, task, fetched = item
+            if not isinstance(fetched[0], str) or not fetched[0]:
+                self.results_queue.put((url, task, fetched, None))
+                continue
+            slots.acquire()
+            with self.lock:
+                self.parsing += 1
+            future = pool.submit(self.parse, fetched[0], task)
+            future.add_done_callback(lambda future, item=item: self.parsed(future, item, slots))
+
+    def parsed(self, future, item, slots):
+        url, task, fetched = item
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error occurred while parsing {url}: {e}")
+            result = None
+        with self.lock:
+            self.parsing -= 1
+        slots.release()
+        self.results_queue.put((url, task, fetched, result))
+
+    def report(self):
+        return (f"Queues: {self.fetch_queue.qsize()} to fetch, {self.html_queue.qsize()}/{self.queue_size} fetched, "
+                f"{self.parsing} parsing, {self.results_queue.qsize()} to store, {self.done} done")
+
+    #Yield (url, task, fetched, parsed) for every page as it is parsed, until no page is left
+    def run(self):
+        with ProcessPoolExecutor(max_workers=self.parsers) as pool:
+            #Start the parser processes before any thread exists
+            pool.submit(os.getpid).result()
+            threads = [threading.Thread(target=self.fetcher, daemon=True) for _ in range(self.fetchers)]
+            threads.append(threading.Thread(target=self.dispatcher, args=(pool,), daemon=True))
+            for thread in threads:
+                thread.start()
+
+            last_report = time.monotonic()
+            try:
+                while self.pending:
+                    try:
+                        item = self.results_queue.get(timeout=1.0)
+                    except queue.Empty:
+                        item = None
+                    if time.monotonic() - last_report >= self.report_every:
+                        print(self.report())
+                        last_report = time.monotonic()
+                    if item is None:
+                        continue
+                    self.pending -= 1
+                    self.done += 1
+                    yield item
+                print(self.report())
+            finally:
+                #Stopping early drops the pages still waiting to be fetched
+                with self.fetch_queue.mutex:
+                    self.fetch_queue.queue.clear()
+                for _ in range(self.fetchers):
+                    self.fetch_queue.put(None)
+                try:
+                    self.html_queue.put(None, timeout=1.0)
+                except queue.Full:
+                    pass
@@ -0,0 +1,208 @@
+import json
+import time
+import itertools
+import sqlite3
+import hashlib
+import threading
+from crawl_state import content_hash
+from corpus import source_fingerprint
+
+#SQLite storage for scraped pages (scraped_data.db).
+#Pages are keyed by URL and written in batches, one transaction and one executemany per batch.
+#The database runs in WAL mode with synchronous=NORMAL, so a commit appends to the log without
+#an fsync and readers (the QA side) are never blocked by the scraper. scraped_info_fts is an
+#FTS5 index over title and content kept up to date by triggers, for retrieving straight from the DB.
+
+SCRAPED_DB = 'scraped_data.db'
+
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA busy_timeout = 5000',
+]
+
+COLUMNS = {
+    'url': 'TEXT',
+    'content_hash': 'TEXT',
+    'first_fetched': 'REAL',
+    'last_fetched': 'REAL',
+    'last_changed': 'REAL',
+}
+
+FTS_SCHEMA = [
+    '''CREATE VIRTUAL TABLE scraped_info_fts USING fts5(title, content, content='scraped_info', content_rowid='id')''',
+    '''CREATE TRIGGER scraped_info_ai AFTER INSERT ON scraped_info BEGIN
+           INSERT INTO scraped_info_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+       END''',
+    '''CREATE TRIGGER scraped_info_ad AFTER DELETE ON scraped_info BEGIN
+           INSERT INTO scraped_info_fts (scraped_info_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+       END''',
+    '''CREATE TRIGGER scraped_info_au AFTER UPDATE OF title, content ON scraped_info BEGIN
+           INSERT INTO scraped_info_fts (scraped_info_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+           INSERT INTO scraped_info_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+       END''',
+]
+
+UPSERT_PAGE = '''INSERT INTO scraped_info (url, title, content, content_hash, first_fetched, last_fetched, last_changed)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                 ON CONFLICT(url) DO UPDATE SET
+                    title = excluded.title,
+                    content = excluded.content,
+                    last_fetched = excluded.last_fetched,
+                    last_changed = CASE WHEN scraped_info.content_hash IS excluded.content_hash
+                                        THEN scraped_info.last_changed ELSE excluded.last_changed END,
+                    content_hash = excluded.content_hash'''
+
+INSERT_PAGE = '''INSERT INTO scraped_info (title, content, content_hash, first_fetched, last_fetched, last_changed)
+                 VALUES (?, ?, ?, ?, ?, ?)'''
+
+#Open the database, creating or upgrading the schema
+def open_db(path=SCRAPED_DB, check_same_thread=True):
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS scraped_info (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            title TEXT,
+                            content TEXT
+                        )''')
+        #Tables created by older scrapers only have some of the columns
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(scraped_info)')}
+        for column, column_type in COLUMNS.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE scraped_info ADD COLUMN {column} {column_type}')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS scraped_info_url ON scraped_info (url)')
+        conn.execute('CREATE INDEX IF NOT EXISTS scraped_info_hash ON scraped_info (content_hash)')
+
+        missing = conn.execute('SELECT id, title, content FROM scraped_info WHERE content_hash IS NULL').fetchall()
+        conn.executemany('UPDATE scraped_info SET content_hash = ? WHERE id = ?',
+                         [(content_hash(title, content), row_id) for row_id, title, content in missing])
+
+        if not has_fts(conn):
+            try:
+                for statement in FTS_SCHEMA:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO scraped_info_fts (scraped_info_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError as e:
+                print(f"Full-text search is not available in this SQLite build: {e}")
+    return conn
+
+def has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'scraped_info_fts'").fetchone() is not None
+
+#Write (url, title, content) rows in one transaction. Pages are upserted by URL (a copy saved
+#before URLs were recorded is replaced); rows without a URL are inserted as they are.
+def store_pages(conn, rows):
+    now = time.time()
+    with_url = []
+    without_url = []
+    for url, title, content in rows:
+        page_hash = content_hash(title, content)
+        if url is None:
+            without_url.append((title, content, page_hash, now, now, now))
+        else:
+            with_url.append((url, title, content, page_hash, now, now, now))
+
+    with conn:
+        conn.executemany('DELETE FROM scraped_info WHERE url IS NULL AND content_hash = ?', [(row[3],) for row in with_url])
+        conn.executemany(UPSERT_PAGE, with_url)
+        conn.executemany(INSERT_PAGE, without_url)
+
+
+class PageWriter:
+    #Buffers scraped pages and stores them batch_size at a time.
+    #ingest is an optional dedup.IngestFilter every page goes through first.
+    def __init__(self, conn, batch_size=500, ingest=None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.ingest = ingest
+        self.rows = []
+        self.written = 0
+
+    def add(self, title, content, url=None):
+        if self.ingest:
+            doc = self.ingest.filter({'title': title, 'content': content, 'url': url})
+            if doc is None:
+                return
+            content = doc['content']
+        self.rows.append((url, title, content))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, rows):
+        for url, title, content in rows:
+            self.add(title, content, url)
+
+    def flush(self):
+        if self.rows:
+            store_pages(self.conn, self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+#FTS5 query matching any of the tokens; each token is quoted so punctuation isn't read as syntax
+def fts_query(query_tokens):
+    return ' OR '.join('"' + token.replace('"', '""') + '"' for token in query_tokens)
+
+
+class FTSIndex:
+    #Ranks documents with the database's own FTS5 index (SQLite's bm25), in place of the BM25 index
+    #built from the corpus. Document ids are positions in load_documents(source), as for BM25Index.
+    def __init__(self, source=SCRAPED_DB):
+        self.source = source
+        self.conn = open_db(source, check_same_thread=False)
+        if not has_fts(self.conn):
+            raise RuntimeError(f"{source} has no full-text index")
+        self.fingerprint = source_fingerprint(source)
+        self.lock = threading.Lock()
+        #The documents are read here, in the same snapshot as their ids
+        rows = self.conn.execute('''SELECT id, title, content, content_hash FROM scraped_info
+                                    WHERE content IS NOT NULL ORDER BY id''').fetchall()
+        self.documents = [{'title': title or '', 'content': content} for _, title, content, _ in rows]
+        self.row_ids = [row[0] for row in rows]
+        self.positions = {row_id: i for i, row_id in enumerate(self.row_ids)}
+        self.corpus_size = len(rows)
+        self.corpus_hash = hashlib.sha1(json.dumps([[row[0], row[3]] for row in rows]).encode('utf-8')).hexdigest()
+
+    #True if pages were written since the index was opened
+    def is_stale(self):
+        return source_fingerprint(self.source) != self.fingerprint
+
+    #Top document ids for the query; doc_ids restricts the search to those documents.
+    #Documents that don't match any token fill the remaining places, highest id first.
+    def search(self, query_tokens, top_n=3, doc_ids=None):
+        ranked = []
+        if query_tokens:
+            sql = 'SELECT rowid FROM scraped_info_fts WHERE scraped_info_fts MATCH ?'
+            params = [fts_query(query_tokens)]
+            if doc_ids is not None:
+                sql += ' AND rowid IN (SELECT value FROM json_each(?))'
+                params.append(json.dumps([self.row_ids[i] for i in doc_ids]))
+            sql += ' ORDER BY bm25(scraped_info_fts) LIMIT ?'
+            params.append(top_n)
+            with self.lock:
+                rows = self.conn.execute(sql, params).fetchall()
+            #Pages written after the index was opened aren't in the documents yet
+            ranked = [self.positions[row_id] for row_id, in rows if row_id in self.positions]
+        if len(ranked) < top_n:
+            found = set(ranked)
+            candidates = reversed(range(self.corpus_size)) if doc_ids is None else sorted(doc_ids, reverse=True)
+            ranked += itertools.islice((i for i in candidates if i not in found), top_n - len(ranked))
+        return ranked
+
+    #queries, the question texts, are accepted as by BM25Index.search_many and not used
+    def search_many(self, queries_tokens, top_n=3, doc_ids=None, queries=None):
+        if doc_ids is None:
+            doc_ids = [None] * len(queries_tokens)
+        return [self.search(tokens, top_n, ids) for tokens, ids in zip(queries_tokens, doc_ids)]
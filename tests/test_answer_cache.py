@@ -0,0 +1,72 @@
+import pytest
+import qa_engine
+from answer_cache import AnswerCache, cache_key, normalize_question
+from jsonl_corpus import append_documents
+
+def test_normalize_question():
+    assert normalize_question("  What is Computer   Science 1025? ") == "what is computer science 1025"
+    assert normalize_question("What is Computer Science 1025") == normalize_question("what is computer science 1025?!")
+
+def test_cache_key_depends_on_question_model_and_corpus():
+    key = cache_key("What is Computer Science 1025?", 'model', 'corpus')
+    assert cache_key("what is computer science 1025", 'model', 'corpus') == key
+    assert cache_key("What is Computer Science 1026?", 'model', 'corpus') != key
+    assert cache_key("What is Computer Science 1025?", 'other model', 'corpus') != key
+    assert cache_key("What is Computer Science 1025?", 'model', 'new corpus') != key
+
+def test_cache_persists_and_purges_old_corpus_versions(tmp_path):
+    db_path = str(tmp_path / 'answers.db')
+    cache = AnswerCache(capacity=1, db_path=db_path)
+    cache.put('old', {'answer': 'a'}, 'v1')
+    cache.put('new', {'answer': 'b'}, 'v2')
+    #Evicted from memory but still in the database
+    assert cache.get('old') == {'answer': 'a'}
+
+    cache.purge('v2')
+    assert cache.get('old') is None
+    assert AnswerCache(db_path=db_path).get('new') == {'answer': 'b'}
+
+
+class CountingBackend(qa_engine.Backend):
+    #Answers with the number of times it ran, so a cached answer is told apart from a new one
+    calls = 0
+
+    def run(self, retriever, questions, contexts, context_docs, batch_size):
+        results = []
+        for _ in questions:
+            CountingBackend.calls += 1
+            results.append({'answer': f"answer {CountingBackend.calls}", 'score': 1.0})
+        return results
+
+@pytest.fixture
+def engine_factory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(qa_engine.BACKEND_TYPES, 'counting', CountingBackend)
+    monkeypatch.setitem(qa_engine.BACKENDS, 'counting', {'type': 'counting', 'model': 'none', 'min_words': 0})
+    monkeypatch.setattr(CountingBackend, 'calls', 0)
+    append_documents('corpus.jsonl', [
+        {'title': 'CS 1025', 'content': 'Computer Science 1025 introduces programming', 'url': 'u1'},
+        {'title': 'Software', 'content': 'Students get free software', 'url': 'u2'},
+    ])
+
+    def create(cache, **options):
+        return qa_engine.QAEngine(['counting'], source='corpus.jsonl', cache=cache,
+                                  backend_options={'counting': options})
+    return create
+
+def test_engine_reuses_answers_until_model_or_corpus_changes(engine_factory):
+    cache = AnswerCache()
+    engine = engine_factory(cache)
+    first = engine.answer_question("What is Computer Science 1025?")
+    assert engine.answer_question("  what is computer science 1025 ") == first
+    assert CountingBackend.calls == 1
+
+    #Another model configuration doesn't get the first one's answers
+    other = engine_factory(cache, top_n=2)
+    assert other.answer_question("What is Computer Science 1025?") != first
+    assert CountingBackend.calls == 2
+
+    #New scraped pages give a new corpus version
+    append_documents('corpus.jsonl', [{'title': 'Grants', 'content': 'Research grants from NSERC', 'url': 'u3'}])
+    assert engine.answer_question("What is Computer Science 1025?") != first
+    assert CountingBackend.calls == 3
@@ -0,0 +1,67 @@
+import re
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urljoin
+import pytest
+from async_crawler import crawl
+from robots_cache import RobotsCache
+
+CRAWL_DELAY = 0.2
+
+PAGES = {
+    '/robots.txt': f"User-agent: *\nDisallow: /private\nCrawl-delay: {CRAWL_DELAY}\n",
+    '/': '<a href="/a">A</a> <a href="/b">B</a> <a href="/private/x">X</a>',
+    '/a': '<a href="/">Home</a> <a href="/b">B</a>',
+    '/b': '<a href="/c">C</a>',
+    '/c': 'No links',
+    '/private/x': 'Disallowed',
+}
+
+#Local site serving PAGES; requests holds the (path, time) of every request it answered
+@pytest.fixture
+def site():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append((self.path, time.monotonic()))
+            body = PAGES.get(self.path)
+            self.send_response(200 if body is not None else 404)
+            self.send_header('Content-Type', 'text/html' if self.path != '/robots.txt' else 'text/plain')
+            self.end_headers()
+            self.wfile.write((body or '').encode('utf-8'))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", requests
+    server.shutdown()
+    server.server_close()
+
+def handle_page(url, page_html):
+    return [urljoin(url, href) for href in re.findall(r'href="([^"]+)"', page_html)]
+
+
+def test_crawl_follows_links_and_robots_txt(site):
+    base, requests = site
+    visited = crawl([f"{base}/"], handle_page, robots_cache=RobotsCache(path=None))
+
+    assert visited == {f"{base}{path}" for path in ('/', '/a', '/b', '/c')}
+    paths = [path for path, _ in requests]
+    assert paths.count('/robots.txt') == 1
+    assert '/private/x' not in paths
+    #Every page is fetched once
+    assert sorted(paths) == sorted(['/robots.txt', '/', '/a', '/b', '/c'])
+
+def test_crawl_spaces_requests_by_crawl_delay(site):
+    base, requests = site
+    crawl([f"{base}/"], handle_page, concurrency=4, robots_cache=RobotsCache(path=None))
+
+    times = [when for path, when in requests if path != '/robots.txt']
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    #Allow for timer resolution
+    assert min(gaps) >= CRAWL_DELAY * 0.9
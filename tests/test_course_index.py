@@ -0,0 +1,71 @@
+import re
+from course_index import CourseCodeIndex, course_code_variants, extract_course_code, normalize_course_code
+
+DOCUMENTS = [
+    {'title': 'Computer Science 1025A/B', 'content': 'Computer Science Fundamentals I. Antirequisite: Computer Science 1026A/B/Y.'},
+    {'title': 'Computer Science 1026A/B/Y', 'content': 'Computer Science Fundamentals II.'},
+    {'title': 'Computer Science 4447', 'content': 'Prerequisite(s): Computer Science 3307A/B and Computer Science 3350A/B.'},
+    {'title': 'COMPSCI 3307A/B', 'content': 'Object-Oriented Design and Analysis.'},
+    {'title': 'Free software', 'content': 'Students in computer science 2212 get free software.'},
+    {'title': 'Research grants', 'content': 'Sources include NSERC, CFI and ORF.'},
+]
+
+QUESTIONS = [
+    "What are the prerequisites for Computer Science 4447?",
+    "What is Computer Science 1025 about?",
+    "What is Computer Science 1025A/B about?",
+    "Which course is an antirequisite of Computer Science 1026A/B/Y?",
+    "Who can take Computer Science 3307A/B?",
+    "Is Computer Science 3350A/B required?",
+]
+
+#The filter the QA scripts used before the index: a case-insensitive regex for the code, then a
+#case-sensitive substring test on the title and content
+def substring_filter(question, documents):
+    match = re.search(r'Computer Science \d{4}[A-Z]?/?[A-Z]?', question, re.IGNORECASE)
+    if not match:
+        return None
+    code = match.group(0)
+    return [i for i, doc in enumerate(documents) if code in doc.get('title', '') or code in doc.get('content', '')]
+
+
+def test_normalize_course_code():
+    assert normalize_course_code('Computer Science', '4447', 'a/b') == 'COMPSCI 4447A/B'
+    assert normalize_course_code('computer  science', '1025') == 'COMPSCI 1025'
+    assert normalize_course_code('compsci', '2212', 'Y') == 'COMPSCI 2212Y'
+    assert extract_course_code("what is computer science 1025a/b about?") == 'COMPSCI 1025A/B'
+    assert extract_course_code("What is COMPSCI 4447?") == 'COMPSCI 4447'
+    assert extract_course_code("What does the department occupy?") is None
+
+def test_course_code_variants():
+    assert course_code_variants('Computer Science', '1026', 'A/B/Y') == {
+        'COMPSCI 1026', 'COMPSCI 1026A', 'COMPSCI 1026B', 'COMPSCI 1026Y', 'COMPSCI 1026A/B', 'COMPSCI 1026A/B/Y'}
+    assert course_code_variants('Computer Science', '4447') == {'COMPSCI 4447'}
+
+#Every document the substring filter found is found by the index
+def test_lookup_finds_what_the_substring_filter_found():
+    index = CourseCodeIndex(DOCUMENTS)
+    for question in QUESTIONS:
+        found = substring_filter(question, DOCUMENTS)
+        assert found
+        assert set(found) <= set(index.lookup_question(question)), question
+
+#The index also finds the spellings and suffixes the substring filter missed
+def test_lookup_finds_other_spellings_and_suffixes():
+    index = CourseCodeIndex(DOCUMENTS)
+    assert substring_filter("Who can take computer science 3307?", DOCUMENTS) == []
+    assert index.lookup_question("Who can take computer science 3307?") == [2, 3]
+    assert index.lookup_question("Is computer science 2212 free?") == [4]
+    assert index.lookup_question("What is Computer Science 1026B?") == [0, 1]
+    assert index.lookup_question("What is Computer Science 1026A/B?") == [0, 1]
+    assert index.lookup("COMPSCI 1025", fields=('title',)) == [0]
+    assert index.lookup_question("What is Computer Science 9999?") is None
+    assert index.lookup_question("Where are research grants from?") is None
+
+def test_update_reindexes_and_removes_documents():
+    index = CourseCodeIndex(DOCUMENTS)
+    index.update(2, {'title': 'Computer Science 4448', 'content': 'No prerequisites.'})
+    index.update(3, None)
+    assert index.lookup('COMPSCI 4447') == []
+    assert index.lookup('COMPSCI 4448') == [2]
+    assert index.lookup('COMPSCI 3307') == []
@@ -0,0 +1,97 @@
+import numpy as np
+from dedup import (IngestFilter, MinHasher, TemplateModel, dedup_corpus, estimated_similarity,
+                   shingle_hashes, SHINGLE_WORDS)
+from jsonl_corpus import JSONLCorpus, append_documents
+
+FOOTER = ("Department of Computer Science Western University Middlesex College Room 355 London Ontario "
+          "Canada N6A 5B7 Tel 519 661 3566 Privacy | Web Standards | Terms of Use | Accessibility "
+          "Copyright Western University").split()
+SHARED_FACT = "3 lecture hours. Course Weight: 0.50".split()
+
+def words(seed, count=80):
+    generator = np.random.RandomState(seed)
+    return [f"w{value}" for value in generator.randint(0, 5000, size=count)]
+
+#Page text with a fact shared by many pages in the middle
+def text(seed):
+    page_words = words(seed)
+    return page_words[:40] + SHARED_FACT + page_words[40:]
+
+def page(seed, title=None, url=None, footer=False):
+    content = text(seed)
+    if footer:
+        content = content + FOOTER
+    return {'title': title or f"Page {seed}", 'content': ' '.join(content),
+            'url': url or f"https://csd.uwo.ca/page-{seed}"}
+
+
+def test_minhash_estimates_jaccard_similarity():
+    hasher = MinHasher()
+    base = words(1, 200)
+    edited = base[:190] + words(2, 10)
+    a, b = set(shingle_hashes(base, SHINGLE_WORDS).tolist()), set(shingle_hashes(edited, SHINGLE_WORDS).tolist())
+    jaccard = len(a & b) / len(a | b)
+    estimate = estimated_similarity(hasher.signature(shingle_hashes(base, SHINGLE_WORDS)),
+                                    hasher.signature(shingle_hashes(edited, SHINGLE_WORDS)))
+    assert abs(estimate - jaccard) < 0.1
+    assert estimated_similarity(hasher.signature(shingle_hashes(base, SHINGLE_WORDS)),
+                                hasher.signature(shingle_hashes(words(3, 200), SHINGLE_WORDS))) < 0.1
+
+#A copy of a stored page under another URL is dropped, unless its title differs
+def test_near_duplicates_are_dropped():
+    ingest = IngestFilter([page(1), page(2)], min_words=5)
+    copy = dict(page(1), url='https://csd.uwo.ca/copy-of-page-1')
+    edited = dict(copy, content=copy['content'] + ' one more word')
+    assert ingest.filter(copy) is None
+    assert ingest.filter(edited) is None
+    assert ingest.filter(dict(copy, title='Another course')) is not None
+    assert ingest.filter(page(3)) is not None
+    assert ingest.duplicates == 2
+
+#A page scraped again under its own URL replaces the stored one and is kept
+def test_rescraped_page_is_kept():
+    ingest = IngestFilter([page(1)])
+    assert ingest.filter(page(1)) == page(1)
+    assert ingest.filter_rows([(page(1)['url'], page(1)['title'], page(1)['content'])]) == [
+        (page(1)['url'], page(1)['title'], page(1)['content'])]
+    assert ingest.duplicates == 0
+
+#The footer shared by the site's pages is stripped; short shared facts and other sites are not
+def test_template_model_strips_the_site_footer():
+    templates = TemplateModel()
+    pages = [page(seed, footer=True) for seed in range(10)]
+    for doc in pages:
+        templates.add('csd.uwo.ca', doc['content'].split())
+    stripped = templates.strip('csd.uwo.ca', pages[0]['content'].split())
+    assert stripped == text(0)
+    assert templates.strip('westerncalendar.uwo.ca', pages[0]['content'].split()) == pages[0]['content'].split()
+
+    ingest = IngestFilter(pages)
+    new_page = page(42, footer=True)
+    assert ingest.filter(new_page)['content'] == ' '.join(text(42))
+    assert ingest.stripped_words == len(FOOTER)
+
+#Too few pages share the footer to tell it from the page text
+def test_template_model_keeps_text_of_few_pages():
+    templates = TemplateModel()
+    pages = [page(seed, footer=True) for seed in range(3)]
+    for doc in pages:
+        templates.add('csd.uwo.ca', doc['content'].split())
+    assert templates.strip('csd.uwo.ca', pages[0]['content'].split()) == pages[0]['content'].split()
+
+#A page left with only template text has nothing of its own and is dropped
+def test_page_of_template_text_only_is_dropped():
+    ingest = IngestFilter([page(seed, footer=True) for seed in range(10)])
+    assert ingest.filter({'title': 'Contact', 'content': ' '.join(FOOTER), 'url': 'https://csd.uwo.ca/contact'}) is None
+    assert ingest.empty == 1
+
+def test_dedup_corpus(tmp_path):
+    source = str(tmp_path / 'corpus.jsonl')
+    output = str(tmp_path / 'deduped.jsonl')
+    pages = [page(seed, footer=True) for seed in range(10)]
+    append_documents(source, pages + [dict(pages[3], url='https://csd.uwo.ca/mirror')])
+    total, kept, ingest = dedup_corpus(source, output)
+    assert (total, kept, ingest.duplicates) == (11, 10, 1)
+    corpus = JSONLCorpus(output)
+    assert [doc['content'] for doc in corpus] == [' '.join(text(seed)) for seed in range(10)]
+    corpus.close()
@@ -0,0 +1,38 @@
+import os
+import sys
+import subprocess
+
+#A reader that has the dense index memory-mapped, while it is rebuilt from a smaller corpus.
+#The stub encoder hashes words into a small normalized bag-of-words vector.
+REBUILD_WHILE_MAPPED = '''
+import sys
+import zlib
+import numpy as np
+from dense_index import build_dense_index, DenseIndex
+
+class HashingEncoder:
+    model_name = 'hashing'
+    dim = 32
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                vectors[row, zlib.crc32(word.encode('utf-8')) % self.dim] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+index_dir = sys.argv[1]
+encoder = HashingEncoder()
+build_dense_index(["page %d about topic%d" % (i, i) for i in range(3000)], encoder, index_dir)
+reader = DenseIndex(index_dir, encoder)
+reader.search_many(["topic7"], 3)
+build_dense_index(["one page"], encoder, index_dir)
+print(len(reader.search_many(["topic7"], 3)[0]))
+print(DenseIndex(index_dir, encoder).search_many(["one page"], 3))
+'''
+
+def test_rebuild_leaves_mapped_readers_working(tmp_path):
+    result = subprocess.run([sys.executable, '-c', REBUILD_WHILE_MAPPED, str(tmp_path / 'dense')],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[:2] == ['3', '[[0]]']
@@ -0,0 +1,37 @@
+import pytest
+import qa_engine
+from scraped_store import open_db, store_pages, has_fts, FTSIndex
+
+PAGES = [
+    ('u1', 'CS 1025', 'Computer Science 1025 introduces programming'),
+    ('u2', 'Software', 'Students get free software from the department'),
+    ('u3', 'Grants', 'Research grants come from NSERC'),
+]
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'scraped_data.db')
+    conn = open_db(path)
+    if not has_fts(conn):
+        pytest.skip("SQLite was built without FTS5")
+    store_pages(conn, PAGES)
+    conn.close()
+    return path
+
+class ContextBackend(qa_engine.Backend):
+    #Answers with the title of the first document of its context
+    def run(self, retriever, questions, contexts, context_docs, batch_size):
+        return [{'answer': retriever.documents[doc_ids[0]]['title'], 'score': 1.0} for doc_ids in context_docs]
+
+
+def test_fts_search(db_path):
+    index = FTSIndex(db_path)
+    assert index.search(['grants'], 1) == [2]
+    assert index.search_many([['free', 'software'], ['grants']], 1, queries=['free software?', 'grants?']) == [[1], [2]]
+
+def test_engine_answers_with_fts_retrieval(db_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(qa_engine.BACKEND_TYPES, 'context', ContextBackend)
+    monkeypatch.setitem(qa_engine.BACKENDS, 'context', {'type': 'context', 'model': 'none', 'min_words': 0, 'top_n': 1, 'fallback_top_n': 1})
+    engine = qa_engine.QAEngine(['context'], source=db_path, retrieval='fts')
+    assert engine.answer_questions(["Where do research grants come from?", "Is there free software?"]) == ['Grants', 'Software']
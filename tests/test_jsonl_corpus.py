@@ -0,0 +1,113 @@
+import os
+from jsonl_corpus import append_documents, compact, committed_lines, index_path, JSONLCorpus, RECORD
+from dedup import corpus_filter
+
+LEGACY = [
+    {'title': 'Computer Science 4447', 'content': 'Software design. Prerequisite: Computer Science 2212 and 2210 with marks of at least 60 percent.'},
+    {'title': 'Graduate Students', 'content': 'Information for graduate students in the department of computer science.'},
+    {'title': 'Graduate Students', 'content': 'Funding and scholarships for graduate students in computer science.'},
+]
+
+PAGES = [
+    {'title': 'Computer Science 1025', 'content': 'Computer Science Fundamentals I.', 'url': 'https://example.com/1025'},
+    {'title': 'Computer Science 1026', 'content': 'Computer Science Fundamentals II.', 'url': 'https://example.com/1026'},
+]
+
+#The newest line of a page wins and the page keeps its position
+def test_newest_line_wins(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    append_documents(path, PAGES)
+    reader = JSONLCorpus(path)
+    changed = dict(PAGES[0], content='Computer Science Fundamentals I, now in Python.')
+    newer = dict(changed, content='Computer Science Fundamentals I, in Python and Java.')
+    append_documents(path, [changed, newer])
+    assert reader.update() == [0]
+    assert list(reader) == [newer, PAGES[1]]
+    assert list(JSONLCorpus(path)) == [newer, PAGES[1]]
+    assert committed_lines(path) == 4
+
+#Lines and sidecar records a writer left behind when it died are not read, and the next append
+#cuts them off
+def test_torn_write_is_ignored_and_cut_off(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    append_documents(path, PAGES[:1])
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'{"title": "Computer Science 1026", "content": "Computer Sci')
+    assert list(JSONLCorpus(path)) == PAGES[:1]
+
+    #A line written in full whose record was cut short
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+        f.seek(size)
+        f.write(b'{"title": "half", "content": "written", "url": "https://example.com/half"}\n')
+    with open(index_path(path), 'ab') as f:
+        f.write(b'\0' * (RECORD.size // 2))
+    assert committed_lines(path) == 1
+    assert list(JSONLCorpus(path)) == PAGES[:1]
+
+    append_documents(path, PAGES[1:])
+    assert list(JSONLCorpus(path)) == PAGES
+    assert os.path.getsize(index_path(path)) == 2 * RECORD.size
+    with open(path, 'rb') as f:
+        assert b'half' not in f.read()
+
+#A compacted corpus keeps only the newest lines; readers opened before are told to reopen it
+def test_update_after_compact(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    append_documents(path, PAGES)
+    changed = dict(PAGES[1], content='Computer Science Fundamentals II, with data structures.')
+    append_documents(path, [changed])
+    reader = JSONLCorpus(path)
+    compact(path)
+    assert reader.update() is None
+    assert list(reader) == [PAGES[0], changed]
+    reader.close()
+
+    corpus = JSONLCorpus(path)
+    assert list(corpus) == [PAGES[0], changed]
+    assert committed_lines(path) == 2
+    added = {'title': 'Computer Science 2210', 'content': 'Data Structures and Algorithms.', 'url': 'https://example.com/2210'}
+    append_documents(path, [added])
+    assert corpus.update() == [2]
+    assert list(corpus) == [PAGES[0], changed, added]
+    corpus.close()
+
+#A page scraped with its URL replaces the copy saved before URLs were recorded
+def test_page_with_url_replaces_legacy_line(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    append_documents(path, LEGACY)
+    reader = JSONLCorpus(path)
+
+    changed = dict(LEGACY[0], content='Software design. Prerequisite: Computer Science 3307.', url='https://example.com/4447')
+    append_documents(path, [changed])
+    assert reader.update() == [0]
+    assert reader[0] == changed
+    corpus = JSONLCorpus(path)
+    assert len(corpus) == 3
+    assert list(corpus) == [changed, LEGACY[1], LEGACY[2]]
+
+    #Later scrapes of the page replace it by URL as usual
+    again = dict(changed, content='Software design. Prerequisite: Computer Science 3307 or 3350.')
+    append_documents(path, [again])
+    assert list(JSONLCorpus(path)) == [again, LEGACY[1], LEGACY[2]]
+
+#Of several legacy pages sharing a title, only the first is replaced
+def test_legacy_pages_sharing_a_title(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    append_documents(path, LEGACY)
+    page = dict(LEGACY[1], url='https://example.com/grad')
+    append_documents(path, [page])
+    assert list(JSONLCorpus(path)) == [LEGACY[0], page, LEGACY[2]]
+
+#The ingest filter lets an unchanged re-scrape through instead of dropping it as a near-duplicate
+def test_ingest_filter_keeps_rescrape_of_legacy_page(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    append_documents(path, LEGACY)
+    ingest = corpus_filter(path)
+    page = dict(LEGACY[0], url='https://example.com/4447')
+    assert ingest.filter(page) == page
+    append_documents(path, [page])
+    assert list(JSONLCorpus(path)) == [page, LEGACY[1], LEGACY[2]]
+    #A copy of the page under another URL still is one
+    assert ingest.filter(dict(page, url='https://example.com/copy')) is None
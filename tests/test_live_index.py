@@ -0,0 +1,57 @@
+import numpy as np
+from retrieval_index import build_index, BM25Index, LiveIndex, tokenize
+
+DOCUMENTS = [
+    "Computer Science 1025 introduces programming in Python",
+    "Computer Science 4447 covers software engineering and testing",
+    "The department offers free software to Computer Science students",
+    "Research grants come from NSERC CFI and ORF",
+    "Computer Science students can join the student council",
+    "Office hours are posted on the course page",
+    "The department occupies Middlesex College",
+    "Computer Science Computer Science Computer Science",
+]
+
+QUERIES = [
+    "Computer Science 1025",
+    "free software for students",
+    "research grants",
+    "What does the department occupy?",
+    "nothing matches this",
+    "Computer Science Computer Science",
+]
+
+def build(tmp_path, documents, name):
+    index_dir = str(tmp_path / name)
+    build_index(documents, index_dir)
+    return index_dir
+
+
+def test_live_index_appends_and_replacements_match_rebuild(tmp_path):
+    live = LiveIndex(build(tmp_path, DOCUMENTS[:5], 'live'))
+    updated = DOCUMENTS[:5] + DOCUMENTS[5:]
+    updated[1] = "Computer Science 4447 is now about research software"
+    live.add_documents([1, 5, 6, 7], [updated[1], updated[5], updated[6], updated[7]])
+    rebuilt = BM25Index(build(tmp_path, updated, 'rebuilt'))
+
+    for query in QUERIES:
+        tokens = tokenize(query)
+        assert live.search(tokens, 5) == rebuilt.search(tokens, 5)
+        ids, scores = live.score_candidates(tokens)
+        rebuilt_ids, rebuilt_scores = rebuilt.score_candidates(tokens)
+        order, rebuilt_order = np.argsort(ids), np.argsort(rebuilt_ids)
+        assert np.array_equal(np.asarray(ids)[order], np.asarray(rebuilt_ids)[rebuilt_order])
+        assert np.allclose(scores[order], rebuilt_scores[rebuilt_order])
+    assert live.search_batch([tokenize(query) for query in QUERIES], 5) == [rebuilt.search(tokenize(query), 5) for query in QUERIES]
+
+#A removed document no longer counts, so the others rank as in a rebuild without it
+def test_live_index_removal_matches_rebuild_without_document(tmp_path):
+    live = LiveIndex(build(tmp_path, DOCUMENTS, 'live'))
+    live.add_documents([2], [None])
+    kept = [i for i in range(len(DOCUMENTS)) if i != 2]
+    rebuilt = BM25Index(build(tmp_path, [DOCUMENTS[i] for i in kept], 'rebuilt'))
+
+    for query in QUERIES:
+        ranked = live.search(tokenize(query), len(DOCUMENTS))
+        assert 2 not in ranked
+        assert ranked == [kept[i] for i in rebuilt.search(tokenize(query), len(DOCUMENTS))]
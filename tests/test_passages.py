@@ -0,0 +1,106 @@
+from jsonl_corpus import JSONLCorpus, append_documents
+from passages import Passages, passage_spans, PASSAGE_WORDS, OVERLAP_WORDS
+from retrieval_index import load_live_index
+
+def page(title, sentences, url=None):
+    content = ' '.join(f"{title} sentence {i} has a few more words." for i in range(sentences))
+    return {'title': title, 'content': content, 'url': url or f"https://example.com/{title}"}
+
+PAGES = [page('short', 2), page('long', 40), page('medium', 20)]
+
+class CountingList(list):
+    def __init__(self, items):
+        super().__init__(items)
+        self.reads = 0
+
+    def __getitem__(self, i):
+        self.reads += 1
+        return super().__getitem__(i)
+
+
+#Words with a sentence end every sentence_words words
+def sentences(count, sentence_words):
+    return [f"w{i}." if (i + 1) % sentence_words == 0 else f"w{i}" for i in range(count)]
+
+
+def test_page_that_fits_is_one_passage():
+    assert passage_spans(sentences(PASSAGE_WORDS, 7)) == [(0, PASSAGE_WORDS)]
+    passages = Passages([PAGES[0]])
+    assert passages.spans == [(0, 0, None, None)]
+    assert passages[0] == dict(PAGES[0], doc_id=0, passage=0)
+
+#Without sentence ends, windows of 100 words overlap by 25
+def test_windows_overlap():
+    assert PASSAGE_WORDS == 100 and OVERLAP_WORDS == 25
+    assert passage_spans([f"w{i}" for i in range(250)]) == [(0, 100), (75, 175), (150, 250)]
+    assert passage_spans([f"w{i}" for i in range(101)]) == [(0, 100), (75, 101)]
+
+#Passages end at a sentence end in their second half and start at a sentence start in the overlap
+def test_windows_follow_sentence_boundaries():
+    words = sentences(250, 10)
+    assert passage_spans(words) == [(0, 100), (80, 180), (160, 250)]
+    words = sentences(400, 30)
+    spans = passage_spans(words)
+    assert spans[0] == (0, 90)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert end - start <= PASSAGE_WORDS
+        assert words[end - 1].endswith('.')
+        assert start < next_start < end and end - next_start <= OVERLAP_WORDS
+    assert spans[-1][1] == len(words)
+
+def test_passages_of_a_long_page():
+    passages = Passages(PAGES)
+    words = PAGES[1]['content'].split()
+    spans = passage_spans(words)
+    assert len(passages) == 1 + len(spans) + len(passage_spans(PAGES[2]['content'].split()))
+    assert passages.doc_passages[1] == list(range(1, 1 + len(spans)))
+    for number, (start, end) in enumerate(spans):
+        passage = passages[1 + number]
+        assert passage == {'title': 'long', 'content': ' '.join(words[start:end]), 'url': PAGES[1]['url'],
+                           'doc_id': 1, 'passage': number}
+
+#Saved spans are taken as they are: no page is read until its passages are
+def test_spans_skip_splitting_the_pages():
+    split = Passages(PAGES)
+    documents = CountingList(PAGES)
+    passages = Passages(documents, spans=split.spans_array())
+    assert documents.reads == 0
+    assert passages.spans == split.spans
+    assert passages.doc_passages == split.doc_passages
+    assert list(passages) == list(split)
+
+#Pages the spans don't cover are split
+def test_spans_of_fewer_pages_split_the_rest():
+    documents = CountingList(PAGES)
+    passages = Passages(documents, spans=Passages(PAGES[:2]).spans_array())
+    assert documents.reads == 1
+    assert passages.spans == Passages(PAGES).spans
+
+#Removed passages and pages grown by update() keep their ids through the spans
+def test_spans_of_updated_passages(tmp_path):
+    source = str(tmp_path / 'corpus.jsonl')
+    append_documents(source, PAGES)
+    passages = Passages(JSONLCorpus(source))
+    append_documents(source, [page('medium', 60, PAGES[2]['url']), page('long', 3, PAGES[1]['url']), page('new', 30)])
+    assert passages.update()
+    assert None in list(passages)
+
+    reopened = Passages(JSONLCorpus(source), spans=passages.spans_array())
+    assert reopened.spans == passages.spans
+    assert list(reopened) == list(passages)
+    passages.close()
+    reopened.close()
+
+#A reused live index opens its passages from the saved spans
+def test_live_index_reuses_the_saved_spans(tmp_path):
+    source = str(tmp_path / 'corpus.jsonl')
+    index_dir = str(tmp_path / 'index')
+    append_documents(source, PAGES)
+    built, _ = load_live_index(source, index_dir)
+    append_documents(source, [page('new', 30)])
+    reused, _ = load_live_index(source, index_dir)
+    fresh = Passages(JSONLCorpus(source))
+    assert reused.spans == fresh.spans
+    assert list(reused) == list(fresh)
+    for passages in (built, reused, fresh):
+        passages.close()
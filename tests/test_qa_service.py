@@ -0,0 +1,68 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import qa_engine
+from qa_service import create_server
+from jsonl_corpus import append_documents
+
+class EchoBackend(qa_engine.Backend):
+    #Answers every question with its own text and records the size of every model batch
+    batches = []
+
+    def run(self, retriever, questions, contexts, context_docs, batch_size):
+        EchoBackend.batches.append(len(questions))
+        return [{'answer': f"answer to {question}", 'score': 1.0} for question in questions]
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(qa_engine.BACKEND_TYPES, 'echo', EchoBackend)
+    monkeypatch.setitem(qa_engine.BACKENDS, 'echo', {'type': 'echo', 'model': 'none', 'min_words': 0})
+    monkeypatch.setattr(EchoBackend, 'batches', [])
+    append_documents('corpus.jsonl', [
+        {'title': 'CS 1025', 'content': 'Computer Science 1025 introduces programming', 'url': 'u1'},
+        {'title': 'Software', 'content': 'Students get free software', 'url': 'u2'},
+    ])
+    engine = qa_engine.QAEngine(['echo'], source='corpus.jsonl')
+    #A long wait lets every concurrent request join the first batch
+    server = create_server(engine, '127.0.0.1', 0, max_batch=16, max_wait=0.5)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'), method='POST')
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def test_concurrent_questions_are_answered_in_one_batch(service):
+    questions = [f"What is question {i}?" for i in range(8)]
+    with ThreadPoolExecutor(len(questions)) as pool:
+        results = list(pool.map(lambda question: post(f"{service}/answer", {'question': question}), questions))
+
+    assert [result['answer'] for result in results] == [f"answer to {question}" for question in questions]
+    assert [result['question'] for result in results] == questions
+    stats = get(f"{service}/stats")
+    assert stats['requests'] == len(questions)
+    assert stats['batches'] < len(questions)
+    assert max(EchoBackend.batches) > 1
+    assert stats['routed'] == {'echo': len(questions)}
+
+def test_bad_requests(service):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(f"{service}/answer", {'question': ' '})
+    assert error.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(f"{service}/missing")
+    assert error.value.code == 404
+    assert get(f"{service}/health") == {'status': 'ok'}
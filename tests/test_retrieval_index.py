@@ -0,0 +1,98 @@
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+from retrieval_index import build_index, BM25Index, tokenize
+
+DOCUMENTS = [
+    "Computer Science 1025 introduces programming in Python",
+    "Computer Science 4447 covers software engineering and testing",
+    "The department offers free software to Computer Science students",
+    "Research grants come from NSERC CFI and ORF",
+    "Computer Science students can join the student council",
+    "Office hours are posted on the course page",
+    "The department occupies Middlesex College",
+    "Computer Science Computer Science Computer Science",
+]
+
+QUERIES = [
+    "Computer Science 1025",
+    "free software for students",
+    "research grants",
+    "What does the department occupy?",
+    "nothing matches this",
+    "Computer Science Computer Science",
+]
+
+#Ranking the way the QA scripts did before the index: BM25Okapi scores of every document, argsorted.
+#The default argsort orders equal scores differently between numpy builds; a stable one gives
+#ties to the later document, as the index does.
+def rank_bm25_top(documents, query, top_n):
+    scores = BM25Okapi([tokenize(doc) for doc in documents]).get_scores(tokenize(query))
+    return scores.argsort(kind='stable')[-top_n:][::-1].tolist()
+
+def build(tmp_path, documents, name='index'):
+    index_dir = str(tmp_path / name)
+    build_index(documents, index_dir)
+    return index_dir
+
+
+@pytest.mark.parametrize('top_n', [1, 3, len(DOCUMENTS)])
+def test_search_matches_rank_bm25(tmp_path, top_n):
+    index = BM25Index(build(tmp_path, DOCUMENTS))
+    for query in QUERIES:
+        assert index.search(tokenize(query), top_n) == rank_bm25_top(DOCUMENTS, query, top_n)
+
+def test_scores_match_rank_bm25(tmp_path):
+    index = BM25Index(build(tmp_path, DOCUMENTS))
+    bm25 = BM25Okapi([tokenize(doc) for doc in DOCUMENTS])
+    for query in QUERIES:
+        expected = bm25.get_scores(tokenize(query))
+        ids, scores = index.score_candidates(tokenize(query))
+        full = np.zeros(len(DOCUMENTS))
+        full[np.asarray(ids, dtype=np.int64)] = scores
+        assert np.allclose(full, expected)
+
+#A filtered search ranks as BM25Okapi over only the filtered documents did
+def test_filtered_search_matches_rank_bm25_over_subset(tmp_path):
+    index = BM25Index(build(tmp_path, DOCUMENTS))
+    doc_ids = [0, 1, 4, 7]
+    subset = [DOCUMENTS[i] for i in doc_ids]
+    for query in QUERIES:
+        expected = [doc_ids[i] for i in rank_bm25_top(subset, query, 3)]
+        assert index.search(tokenize(query), 3, doc_ids) == expected
+
+def test_search_batch_matches_search(tmp_path):
+    index = BM25Index(build(tmp_path, DOCUMENTS))
+    queries_tokens = [tokenize(query) for query in QUERIES]
+    assert index.search_batch(queries_tokens, 5) == [index.search(tokens, 5) for tokens in queries_tokens]
+
+#Unfiltered queries of a mixed batch are ranked together, the others one at a time
+def test_search_many_matches_search(tmp_path):
+    index = BM25Index(build(tmp_path, DOCUMENTS))
+    doc_ids = [0, 1, 4, 7]
+    queries_tokens = [tokenize(query) for query in QUERIES]
+    filters = [doc_ids, None] * 3
+    expected = [index.search(tokens, 3, ids) for tokens, ids in zip(queries_tokens, filters)]
+    assert index.search_many(queries_tokens, 3, filters) == expected
+
+#A reader that has the index memory-mapped, while the index is rebuilt from a smaller corpus
+REBUILD_WHILE_MAPPED = '''
+import sys
+from retrieval_index import build_index, BM25Index, tokenize
+index_dir = sys.argv[1]
+build_index(["Computer Science %d covers topic %d" % (i, i) for i in range(5000)], index_dir)
+reader = BM25Index(index_dir)
+reader.search(tokenize("Computer Science 4447"), 3)
+build_index(["Computer Science 1025"], index_dir)
+print(reader.search(tokenize("Computer Science 4447"), 3))
+print(BM25Index(index_dir).search(tokenize("Computer Science 1025"), 1))
+'''
+
+def test_rebuild_leaves_mapped_readers_working(tmp_path):
+    result = subprocess.run([sys.executable, '-c', REBUILD_WHILE_MAPPED, str(tmp_path / 'index')],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[:2] == ['[4447, 4999, 4998]', '[0]']